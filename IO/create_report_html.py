@@ -1,9 +1,42 @@
+import argparse
+import hashlib
 import json
 import os
+import shutil
+import tempfile
 import webbrowser
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from os.path import join as p_join
+import numpy as np
 import pydot
+import summary_store
+from json_loader import load_evaluation_log, load_json, load_records
+from results_index import NO_INDEX, RESULTS_INDEX_FILE, ResultsIndex, update_index
+
+# Size of the write buffer used when streaming report fragments into index.html
+WRITE_BUFFER_SIZE = 1024 * 1024
+# Bump whenever the rendered markup changes, so cached batch fragments of older versions are not reused
+RENDER_CACHE_VERSION = 6
+RENDER_CACHE_DIR = '.render_cache'
+SVG_CACHE_DIR = '.svg_cache'
+# Directory next to index.html holding the sidecar data files of a split report
+SIDECAR_DIR = 'data'
+# Marker file in a render cache entry whose fragment references sidecar files
+SIDECAR_FLAG = 'sidecars'
+ANALYZER_CHARTS = [
+    ('AvgOffspringFit.json', 'AverageOffspringFitness'),
+    ('AvgPopulationFit.json', 'AveragePopulationFitness'),
+    ('BestIndividualFit.json', 'BestIndividualFitness')
+]
+# Only their fitness values are shown, see json_loader.EVALUATION_LOG_FIELDS
+ANALYZER_LOGS = ['individual_evaluation_log.json', 'loader_evaluation_log.json']
+# Default number of points per fitness chart, longer curves are downsampled (the tables keep every generation)
+CHART_POINT_BUDGET = 1000
+# Smallest point budget: the first and the last point and the minimum and maximum of one bucket
+MIN_CHART_POINTS = 4
+# Number of concurrent `dot` processes rendering the pipeline graphs of a Grid section
+DOT_WORKERS = 4
 
 
 def create_list(path):
@@ -28,12 +61,20 @@ def txt_to_html(txt: str):
 
 
 def make_collapsable(html, summary='&#x25BC;'):
+    return open_collapsable(summary) + str(html) + close_collapsable()
+
+
+def open_collapsable(summary='&#x25BC;'):
     return f"""<details>
     <summary>
         {summary}: &#x25BC;
     </summary>
     <div>
-            {html}
+            """
+
+
+def close_collapsable():
+    return """
     </div>
 </details>
 """
@@ -45,10 +86,10 @@ def insert_png(path):
     return html
 
 
-def create_table_of_contents(path):
+def create_table_of_contents(path, cache_path=None, fingerprints=None, index=NO_INDEX):
     html = f"""
     <h3 id="contents_{path}">Table of Contents</h3>
-    <table class="table">
+    <table class="table sortable">
     <thead class="thead-dark">
         <tr>
             <th scope="col">#</th>
@@ -56,41 +97,112 @@ def create_table_of_contents(path):
             <th scope="col">Run</th>
             <th scope="col">Lowest</th>
             <th scope="col">Highest</th>
+            <th scope="col">Mean</th>
+            <th scope="col">Median</th>
+            <th scope="col">Std</th>
+            <th scope="col">Best Run</th>
         </tr>
     </thead>
     <tbody>
     """
-    for i, dirname in enumerate(os.listdir(path)):
-        if os.path.isdir(os.path.join(path, dirname)):
-            src_path = os.path.join(path, dirname, "source.json")
-            overview_path = os.path.join(path, dirname, "overview.json")
-            lowestMCC = 0.0
-            highestMCC = 0.0
-            src_dirname = dirname
-            if os.path.exists(overview_path):
-                with open(overview_path) as of:
-                    data = json.load(of)
-                    for k in range(len(data)):
-                        MCC_value = data[k]['Fitness']['MCC']
-                        if MCC_value is not None:
-                            if MCC_value > highestMCC:
-                                highestMCC = MCC_value
-                            if k == 0:
-                                lowestMCC = MCC_value
-                            elif MCC_value < lowestMCC:
-                                lowestMCC = MCC_value
-                if os.path.exists(src_path):
-                    with open(src_path) as sf:
-                        src_data = json.load(sf)
-                        src_dirname = src_data[0]['trainingDataDirectory']
-            html += make_content_row(i, source=src_dirname, dirname=dirname, lowest=lowestMCC,
-                                     highest=highestMCC)  # TODO write fitness here
+    for i, dirname in enumerate(index.listdir(path)):
+        if index.isdir(os.path.join(path, dirname)):
+            summary = None
+            if cache_path is not None:
+                summary = load_cached_summary(cache_path, dirname, fingerprints[dirname])
+            if summary is None:
+                summary = create_batch_summary(os.path.join(path, dirname), dirname, index)
+                if cache_path is not None:
+                    store_cached_summary(cache_path, dirname, fingerprints[dirname], summary)
+            html += make_content_row(i, dirname=dirname, **summary)
 
     html += '\n</tbody>\n</table><hr/>'
+    html += create_sort_script()
     return html
 
 
+def create_sort_script():
+    """
+        Sorts a table.sortable by the column of a clicked header, toggling between ascending and descending.
+        Cells are compared by their data-value (numbers) if they have one, else by their text. Empty values go last.
+    """
+    return """
+    <script>
+    document.querySelectorAll('table.sortable th').forEach(function (th) {
+        th.style.cursor = 'pointer';
+        th.addEventListener('click', function () {
+            var column = Array.prototype.indexOf.call(th.parentNode.children, th);
+            var tbody = th.closest('table').querySelector('tbody');
+            var ascending = th.dataset.order !== 'asc';
+            th.parentNode.querySelectorAll('th').forEach(function (other) { delete other.dataset.order; });
+            th.dataset.order = ascending ? 'asc' : 'desc';
+            var key = function (row) {
+                var cell = row.children[column];
+                if (cell.dataset.value !== undefined) {
+                    return cell.dataset.value === '' ? null : parseFloat(cell.dataset.value);
+                }
+                return cell.textContent.trim();
+            };
+            Array.from(tbody.querySelectorAll('tr')).sort(function (a, b) {
+                var x = key(a), y = key(b);
+                if (x === null || y === null) {
+                    return (x === null) - (y === null);
+                }
+                return (x < y ? -1 : x > y ? 1 : 0) * (ascending ? 1 : -1);
+            }).forEach(function (row) { tbody.appendChild(row); });
+        });
+    });
+    </script>
+    """
+
+
+def mcc_statistics(runs, mccs):
+    """
+        Lowest, highest, mean, median and std of the MCC values of a batch and the run with the highest MCC.
+        Missing (None) values are ignored; statistics of a batch without any MCC value are None.
+    """
+    mccs = np.array([np.nan if mcc is None else mcc for mcc in mccs], dtype=np.float64)
+    valid = ~np.isnan(mccs)
+    if not valid.any():
+        return {'lowest': None, 'highest': None, 'mean': None, 'median': None, 'std': None, 'best_run': None}
+    values = mccs[valid]
+    return {
+        'lowest': float(values.min()),
+        'highest': float(values.max()),
+        'mean': float(values.mean()),
+        'median': float(np.median(values)),
+        'std': float(values.std()),
+        'best_run': runs[int(np.flatnonzero(valid)[values.argmax()])]
+    }
+
+
+def create_batch_summary(batch_path, dirname, index=NO_INDEX):
+    """
+        Reads source directory and MCC statistics of a test batch for its table of contents row.
+        The MCC values are taken from the batch summary of summary_store.py, if it is up to date.
+    """
+    src_path = os.path.join(batch_path, "source.json")
+    overview_path = os.path.join(batch_path, "overview.json")
+    runs, mccs = [], []
+    src_dirname = dirname
+    if index.exists(overview_path):
+        store = summary_store.load_current_summary(batch_path, index)
+        if store is not None:
+            run_mccs = summary_store.iteration_mccs(store)
+        else:
+            data = load_records(overview_path, ['Iteration', ('Fitness', 'MCC')])
+            run_mccs = [(d.get('Iteration', k), d.get('Fitness', {}).get('MCC')) for k, d in enumerate(data)]
+        runs = [run for run, _ in run_mccs]
+        mccs = [mcc for _, mcc in run_mccs]
+        if index.exists(src_path):
+            src_data = load_json(src_path)
+            src_dirname = src_data[0]['trainingDataDirectory']
+    return {'source': src_dirname, **mcc_statistics(runs, mccs)}
+
+
 def get_col_bar(lowest):
+    if lowest is None:
+        return '-'
     color = "red"
     if 0.3 < lowest < 0.5:
         color = "orange"
@@ -107,18 +219,28 @@ def get_col_bar(lowest):
         """
 
 
-def make_content_row(rowid, source, dirname, lowest, highest):
-    get_col_bar(lowest)
+def make_value_cell(value, digits=4):
+    if value is None:
+        return '<td data-value="">-</td>'
+    text = f'{value:.{digits}f}' if isinstance(value, float) else str(value)
+    return f'<td data-value="{value}">{text}</td>'
+
+
+def make_content_row(rowid, source, dirname, lowest, highest, mean, median, std, best_run):
     return f"""
-        <tr><th scope="row"> {rowid}</th>
+        <tr><th scope="row" data-value="{rowid}"> {rowid}</th>
             <td>{source}</td> 
             <td><a href="#series{dirname}">{dirname}</a></td> 
-            <td>
+            <td data-value="{'' if lowest is None else lowest}">
                 {get_col_bar(lowest)}
             </td> 
-            <td>
+            <td data-value="{'' if highest is None else highest}">
                 {get_col_bar(highest)}
             </td>
+            {make_value_cell(mean)}
+            {make_value_cell(median)}
+            {make_value_cell(std)}
+            {make_value_cell(best_run)}
         </tr>
         """
 
@@ -138,17 +260,15 @@ def json_to_html(json_object):
     return html
 
 
-def convert_file_to_html(file_path, filetypes=None):
+def convert_file_to_html(file_path, filetypes=None, index=NO_INDEX):
     """
         Converts file in file_path if type is in filetypes.
     """
-    if not os.path.exists(file_path):
+    if not index.exists(file_path):
         return to_html_list_element(f'<p>{file_path} not found!</p>')
     file_name = os.path.basename(file_path)
     if check_filetype(file_name, '.json', filetypes):
-        with open(file_path) as file:
-            j = json.load(file)
-            html = json_to_html(j)
+        html = json_to_html(load_json(file_path))
     elif check_filetype(file_name, '.txt', filetypes):
         with open(file_path) as file:
             html = txt_to_html(file.read())
@@ -177,13 +297,13 @@ def check_filetype(file_name, filetype_to_check, eligible_filetypes=None):
 '''
 ================== Config Log ==================
 '''
-def convert_directory_to_html_list(folder, file_types=['json']):
-    if os.path.exists(folder):
+def convert_directory_to_html_list(folder, file_types=['json'], index=NO_INDEX):
+    if index.exists(folder):
         list_elements = ""
-        for file_name in os.listdir(folder):
+        for file_name in index.listdir(folder):
             file_path = p_join(folder, file_name)
             if check_filetypes(file_name, file_types):
-                s = convert_file_to_html(file_path)
+                s = convert_file_to_html(file_path, index=index)
                 list_elements += to_html_list_element(s)
         html = to_html_list(list_elements)
     else:
@@ -191,8 +311,11 @@ def convert_directory_to_html_list(folder, file_types=['json']):
     return html
 
 
-def create_html_report_details(path, batch_name):
-    html = ''
+def create_html_report_details(path, batch_name, svg_cache_path=None, data_path=None, index=NO_INDEX,
+                               point_budget=CHART_POINT_BUDGET):
+    """
+        Yields the report fragments of all default directories of a test batch.
+    """
     default_dirs = [
         'Analyzer',
         'Config',
@@ -203,7 +326,7 @@ def create_html_report_details(path, batch_name):
 
     for dirname in default_dirs:
 
-        html += f"""
+        yield f"""
         <h3 id=anchor{dirname}>Report {dirname}</h3>
         <p>
         <button class="btn btn-primary" type="button" data-toggle="collapse" data-target="#{dirname + batch_name}" aria-expanded="false" aria-controls="{dirname}">Show</button>
@@ -213,33 +336,35 @@ def create_html_report_details(path, batch_name):
         <div class="card card-body">
         """
         if dirname == 'Analyzer':
-            html += create_html_analyzer_section(p_join(path, dirname), batch_name)
+            if data_path is None:
+                yield from create_html_analyzer_section(p_join(path, dirname), batch_name, index, point_budget)
+            else:
+                yield from create_split_html_analyzer_section(p_join(path, dirname), batch_name, data_path, index,
+                                                              point_budget)
 
         if dirname == 'Config':
-            html += create_html_config_section(p_join(path, dirname))
+            yield from create_html_config_section(p_join(path, dirname), index)
 
         if dirname == 'Grid':
-            html += create_html_grid_section(p_join(path, dirname))
+            yield from create_html_grid_section(p_join(path, dirname), svg_cache_path, index)
 
         if dirname == 'Images' or dirname == 'Signals':
-            html += create_html_items_section(p_join(path, dirname))
+            yield from create_html_items_section(p_join(path, dirname), index)
 
         if dirname == 'Log':
             log_path = p_join(path, dirname)
-            if os.path.exists(log_path):
-                html += create_html_log_section(p_join(path, dirname))
+            if index.exists(log_path):
+                yield from create_html_log_section(p_join(path, dirname), index)
 
-        html += f'<a href="#contents_{path}">Up</a>\n'
-        html += '</div></div><hr/>\n'
-
-    return html
+        yield f'<a href="#contents_{path}">Up</a>\n'
+        yield '</div></div><hr/>\n'
 
 
-def insert_images(image_path):
+def insert_images(image_path, index=NO_INDEX):
     html = ""
     i = 0
     max = 2
-    for img in os.listdir(image_path):
+    for img in index.listdir(image_path):
         if check_filetypes(img, ['.jpg', '.png']):
             html += f"<img src='{os.path.join(os.pardir, image_path, img)}' width='25%' height='25%'><br />"
             i += 1
@@ -248,76 +373,147 @@ def insert_images(image_path):
     return html
 
 
-def create_html_items_section(items_path):
-    html = ''
-    if not os.path.exists(items_path):
-        return html + '<p>Empty</p>\n'
-    for iteration in os.listdir(items_path):
+def create_html_items_section(items_path, index=NO_INDEX):
+    if not index.exists(items_path):
+        yield '<p>Empty</p>\n'
+        return
+    yield open_collapsable('<h4>Items</h4>')
+    for iteration in index.listdir(items_path):
         folder = p_join(items_path, iteration)
-        iteration_html = convert_directory_to_html_list(folder, ['.png'])
-        html += to_html_list_element(
+        iteration_html = convert_directory_to_html_list(folder, ['.png'], index)
+        yield to_html_list_element(
             f'Iteration {iteration}: {iteration_html}')
-        html += insert_images(os.path.join(items_path, iteration))
-    return make_collapsable(html, '<h4>Items</h4>')
+        yield insert_images(os.path.join(items_path, iteration), index)
+    yield close_collapsable()
 
 
 '''
 ================== Grid Log ==================
 '''
-def to_svg(dot_graph):
-    svg = ''
-    if os.path.exists(dot_graph):
-        with open(dot_graph, 'r') as f:
-            graphs = pydot.graph_from_dot_data(f.read())
-            graph = graphs[0]
-            svg_data = graph.create_svg()
-            svg += svg_data.decode("utf-8")
-    return svg
-
-
-def create_html_grid_section(grid_path):
-    html = '<h4>Grid</h4>\n'
-    if not os.path.exists(grid_path):
-        return html + '<p>Empty</p>\n'
-    iteration_html = ""
-    for iteration in os.listdir(grid_path):
-        iteration_html += to_html_list_element(
-            make_collapsable(convert_directory_to_html_list(p_join(grid_path, iteration), [".json", ".txt"]),
+def normalize_dot(dot_data):
+    """
+        Unifies line endings and trailing whitespace, so equal graphs written on different platforms share an SVG.
+    """
+    return '\n'.join(line.rstrip() for line in dot_data.splitlines()).strip() + '\n'
+
+
+def render_svg(dot_data):
+    graphs = pydot.graph_from_dot_data(dot_data)
+    graph = graphs[0]
+    svg_data = graph.create_svg()
+    return svg_data.decode("utf-8")
+
+
+def to_svgs(dot_graphs, svg_cache_path=None, workers=DOT_WORKERS, index=NO_INDEX):
+    """
+        Converts the dot files in dot_graphs to SVG and returns them by file path.
+        Graphs are keyed by the hash of their normalized dot source: each distinct graph is rendered once, by a pool
+        of `dot` processes, and stored in svg_cache_path (if given) for later reports.
+    """
+    graph_hashes = {}
+    sources = {}
+    for dot_graph in dot_graphs:
+        if index.exists(dot_graph):
+            with open(dot_graph, 'r') as f:
+                dot_data = normalize_dot(f.read())
+            graph_hash = hashlib.sha1(dot_data.encode('utf-8')).hexdigest()
+            graph_hashes[dot_graph] = graph_hash
+            sources[graph_hash] = dot_data
+
+    svgs = {}
+    misses = []
+    for graph_hash in sources:
+        svg_path = p_join(svg_cache_path, graph_hash + '.svg') if svg_cache_path is not None else None
+        if svg_path is not None and os.path.exists(svg_path):
+            with open(svg_path, 'r', encoding='utf-8') as f:
+                svgs[graph_hash] = f.read()
+        else:
+            misses.append(graph_hash)
+
+    if misses:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for graph_hash, svg in zip(misses, executor.map(render_svg, [sources[h] for h in misses])):
+                svgs[graph_hash] = svg
+                if svg_cache_path is not None:
+                    os.makedirs(svg_cache_path, exist_ok=True)
+                    # own temp file per writer: batches rendered in other processes may store the same graph
+                    fd, tmp_path = tempfile.mkstemp(dir=svg_cache_path, suffix='.tmp')
+                    with open(fd, 'w', encoding='utf-8') as f:
+                        f.write(svg)
+                    os.replace(tmp_path, p_join(svg_cache_path, graph_hash + '.svg'))
+
+    return {dot_graph: svgs[graph_hashes[dot_graph]] if dot_graph in graph_hashes else '' for dot_graph in dot_graphs}
+
+
+def create_html_grid_section(grid_path, svg_cache_path=None, index=NO_INDEX):
+    yield '<h4>Grid</h4>\n'
+    if not index.exists(grid_path):
+        yield '<p>Empty</p>\n'
+        return
+    iterations = index.listdir(grid_path)
+    svgs = to_svgs([p_join(grid_path, iteration, pipeline) for iteration in iterations
+                    for pipeline in ["append_pipeline.txt", "pipeline.txt"]], svg_cache_path, index=index)
+    yield '<ul>\n'
+    for iteration in iterations:
+        yield to_html_list_element(
+            make_collapsable(convert_directory_to_html_list(p_join(grid_path, iteration), [".json", ".txt"], index),
                              f'Iteration {iteration}'))
-        iteration_html += make_collapsable(to_svg(p_join(grid_path, iteration, "append_pipeline.txt")), f'append_pipeline.txt')
-        iteration_html += make_collapsable(to_svg(p_join(grid_path, iteration, "pipeline.txt")), f'pipeline.txt')
-    return html + to_html_list(iteration_html)
+        yield make_collapsable(svgs[p_join(grid_path, iteration, "append_pipeline.txt")], f'append_pipeline.txt')
+        yield make_collapsable(svgs[p_join(grid_path, iteration, "pipeline.txt")], f'pipeline.txt')
+    yield '</ul>\n'
 
 
 '''
 ================== Config Log ==================
 '''
-def create_html_config_section(config_folder):
-    html = '<h4>Config</h4>\n'
-    html += convert_directory_to_html_list(config_folder, ['.txt'])
-    return html
+def create_html_config_section(config_folder, index=NO_INDEX):
+    yield '<h4>Config</h4>\n'
+    yield convert_directory_to_html_list(config_folder, ['.txt'], index)
 
 
-def create_line_chart(data, title, batch_name, iteration):
+def downsample_curve(xs, ys, point_budget=CHART_POINT_BUDGET):
+    """
+        Min/max bucketing: keeps the first and the last point and the minimum and maximum of each of the equally sized
+        buckets in between, so the curve keeps its shape (and its extremes) with at most point_budget points.
+        Of a bucket without any value (all NaN) only the first point is kept. A point_budget of 0 keeps every point,
+        other budgets have to be at least MIN_CHART_POINTS.
+    """
+    if 0 < point_budget < MIN_CHART_POINTS:
+        raise ValueError(f'point budget {point_budget} is below {MIN_CHART_POINTS}')
+    n = len(xs)
+    if point_budget <= 0 or n <= point_budget:
+        return list(xs), list(ys)
+    values = np.asarray(ys, dtype=np.float64)[1:-1]
+    bucket_size = int(np.ceil(len(values) / max((point_budget - 2) // 2, 1)))
+    bucket_count = int(np.ceil(len(values) / bucket_size))
+    buckets = np.full(bucket_count * bucket_size, np.nan)
+    buckets[:len(values)] = values
+    buckets = buckets.reshape(bucket_count, bucket_size)
+    buckets[np.isnan(buckets).all(axis=1)] = 0
+    offsets = np.arange(bucket_count) * bucket_size + 1
+    keep = np.unique(np.concatenate([[0, n - 1],
+                                     offsets + np.nanargmin(buckets, axis=1),
+                                     offsets + np.nanargmax(buckets, axis=1)]))
+    return [xs[k] for k in keep], [ys[k] for k in keep]
+
+
+def chart_points(value):
+    point_budget = int(value)
+    if 0 < point_budget < MIN_CHART_POINTS:
+        raise argparse.ArgumentTypeError(f'has to be 0 or at least {MIN_CHART_POINTS}, got {value}')
+    return point_budget
+
+
+def create_line_chart(data, title, batch_name, iteration, point_budget=CHART_POINT_BUDGET):
     chart_id = title + batch_name + "_" + str(iteration)
+    xs, ys = downsample_curve([d['Generation'] for d in data], [d[title] for d in data], point_budget)
     plot_html = f"""
         <div id="plot_{chart_id}" style="width:100%;max-width:700px"></div>
         <script>
     """
 
-    plot_html += 'var xArray = ['
-    for x in range(len(data)):
-        plot_html += str(data[x]['Generation'])
-        if x < len(data) - 1:
-            plot_html += ','
-    plot_html += "];\n"
-
-    plot_html += 'var yArray = ['
-    for y in range(len(data)):
-        plot_html += str(data[y][title])
-        if y < len(data) - 1:
-            plot_html += ','
-    plot_html += "];\n"
+    plot_html += 'var xArray = [' + ','.join(str(x) for x in xs) + "];\n"
+    plot_html += 'var yArray = [' + ','.join(str(y) for y in ys) + "];\n"
 
     plot_html += """
         // Define Data
@@ -330,8 +526,8 @@ def create_line_chart(data, title, batch_name, iteration):
 
         // Define Layout
         var layout = {
-            xaxis: {range: [0, 10], title: "Generation"},
-            yaxis: {range: [-1, 1], title: "MCC Fitness"},
+            xaxis: {autorange: true, title: "Generation"},
+            yaxis: {autorange: true, title: "MCC Fitness"},
             title: "Fitness Development"
         };
     
@@ -344,64 +540,190 @@ def create_line_chart(data, title, batch_name, iteration):
     return plot_html
 
 
-def create_data_plot(folder, file_name, plot_title, batch_name, iteration):
+def load_curve(folder, file_name, plot_title, iteration, store=None):
+    """
+        Generation and plot_title values of an analyzer curve, taken from the batch summary if there is one.
+    """
+    if store is not None and str(iteration).lstrip('-').isdigit():
+        column = next(c for c, (_, field) in summary_store.CURVES.items() if field == plot_title)
+        generations, values = summary_store.run_curve(store, int(iteration), column)
+        if len(generations):
+            return [{'Generation': g, plot_title: v} for g, v in zip(generations.tolist(), values.tolist())]
+    return load_records(os.path.join(folder, file_name), ['Generation', plot_title])
+
+
+def create_data_plot(folder, file_name, plot_title, batch_name, iteration, index=NO_INDEX, store=None,
+                     point_budget=CHART_POINT_BUDGET):
     plot_html = ''
-    if os.path.exists(os.path.join(folder, file_name)):
-        with open(os.path.join(folder, file_name), 'r') as f:
-            data = json.load(f)
-            plot_html += create_line_chart(data, plot_title, batch_name, iteration)
-            plot_html += '<table class ="table">'
-            plot_html += '<tr><td>Generation</td>'
-            for i in range(len(data)):
-                plot_html += '<td>' + str(data[i]['Generation']) + '</td>'
-            plot_html += '</tr><tr><td>' + plot_title + '</td>'
-            for i in range(len(data)):
-                plot_html += '<td>' + str(data[i][plot_title]) + '</td>'
-            plot_html += '</tr></table>'
+    if index.exists(os.path.join(folder, file_name)):
+        data = load_curve(folder, file_name, plot_title, iteration, store)
+        plot_html += create_line_chart(data, plot_title, batch_name, iteration, point_budget)
+        table_html = '<table class ="table">'
+        table_html += '<tr><td>Generation</td>' + ''.join('<td>' + str(d['Generation']) + '</td>' for d in data)
+        table_html += '</tr><tr><td>' + plot_title + '</td>' + ''.join('<td>' + str(d[plot_title]) + '</td>' for d in data)
+        table_html += '</tr></table>'
+        # The chart may be downsampled, the table holds every generation
+        plot_html += make_collapsable(table_html, f'{plot_title} (all generations)')
     return plot_html
 
 
 '''
 ================== Analyzer Log ==================
 '''
-def create_html_analyzer_section(analyzer_folder, batch_name):
-    html = '<h4>Analyzer</h4>\n'
-    if not os.path.exists(analyzer_folder):
-        return html + '<p>Empty</p>\n'
-    html += '<p>'
-    for iteration in os.listdir(analyzer_folder):
-        html += '<h4 style="background-color:#3379b7;color:white;">Run No. ' + str(iteration) + '</h4>'
+def create_html_analyzer_section(analyzer_folder, batch_name, index=NO_INDEX, point_budget=CHART_POINT_BUDGET):
+    yield '<h4>Analyzer</h4>\n'
+    if not index.exists(analyzer_folder):
+        yield '<p>Empty</p>\n'
+        return
+    store = summary_store.load_current_summary(os.path.dirname(analyzer_folder), index)
+    yield '<p>'
+    for iteration in index.listdir(analyzer_folder):
+        yield '<h4 style="background-color:#3379b7;color:white;">Run No. ' + str(iteration) + '</h4>'
         folder = p_join(analyzer_folder, iteration)
 
-        html += create_data_plot(folder, 'AvgOffspringFit.json', 'AverageOffspringFitness', batch_name, iteration)
-        html += create_data_plot(folder, 'AvgPopulationFit.json', 'AveragePopulationFitness', batch_name, iteration)
-        html += create_data_plot(folder, 'BestIndividualFit.json', 'BestIndividualFitness', batch_name, iteration)
-
-        if os.path.exists(os.path.join(folder, 'individual_evaluation_log.json')):
-            with open(os.path.join(folder, 'individual_evaluation_log.json'), 'r') as f:
-                data = json.load(f)
-                html += make_collapsable(data, 'loader_evaluation_log.json')
-        if os.path.exists(os.path.join(folder, 'loader_evaluation_log.json')):
-            with open(os.path.join(folder, 'loader_evaluation_log.json'), 'r') as f:
-                data = json.load(f)
-                html += make_collapsable(data, 'loader_evaluation_log.json')
-    html += '</table>'
-    return html
+        for file_name, plot_title in ANALYZER_CHARTS:
+            yield create_data_plot(folder, file_name, plot_title, batch_name, iteration, index, store, point_budget)
+
+        for log_name in ANALYZER_LOGS:
+            if index.exists(os.path.join(folder, log_name)):
+                yield make_collapsable(load_evaluation_log(os.path.join(folder, log_name)), log_name)
+    yield '</table>'
+
+
+def make_lazy_collapsable(src, summary, kind='charts'):
+    """
+        Collapsable whose content is fetched from the sidecar file src and rendered when it is opened the first time.
+    """
+    return f"""<details class="sidecar" data-src="{src}" data-kind="{kind}">
+    <summary>
+        {summary}: &#x25BC;
+    </summary>
+    <div></div>
+</details>
+"""
+
+
+def create_split_html_analyzer_section(analyzer_folder, batch_name, data_path, index=NO_INDEX,
+                                       point_budget=CHART_POINT_BUDGET):
+    """
+        Analyzer section of a split report: the fitness values and evaluation logs of each run are written to
+        sidecar files in data_path/batch_name and only loaded by the page when their section is expanded.
+    """
+    yield '<h4>Analyzer</h4>\n'
+    if not index.exists(analyzer_folder):
+        yield '<p>Empty</p>\n'
+        return
+    batch_data_path = p_join(data_path, batch_name)
+    os.makedirs(batch_data_path, exist_ok=True)
+    batch_data_url = f'{os.path.basename(data_path)}/{batch_name}'
+    store = summary_store.load_current_summary(os.path.dirname(analyzer_folder), index)
+    yield '<p>'
+    for iteration in index.listdir(analyzer_folder):
+        yield '<h4 style="background-color:#3379b7;color:white;">Run No. ' + str(iteration) + '</h4>'
+        folder = p_join(analyzer_folder, iteration)
+
+        charts = []
+        for file_name, plot_title in ANALYZER_CHARTS:
+            if index.exists(os.path.join(folder, file_name)):
+                data = load_curve(folder, file_name, plot_title, iteration, store)
+                full_x = [d['Generation'] for d in data]
+                full_y = [d[plot_title] for d in data]
+                x, y = downsample_curve(full_x, full_y, point_budget)
+                charts.append({
+                    'id': plot_title + batch_name + "_" + str(iteration),
+                    'title': plot_title,
+                    'x': x,
+                    'y': y,
+                    'full_x': full_x,
+                    'full_y': full_y
+                })
+        if charts:
+            with open(p_join(batch_data_path, f'{iteration}.json'), 'w') as f:
+                json.dump({'charts': charts}, f)
+            yield make_lazy_collapsable(f'{batch_data_url}/{iteration}.json', 'Fitness Development')
+
+        for log_name in ANALYZER_LOGS:
+            if index.exists(os.path.join(folder, log_name)):
+                with open(p_join(batch_data_path, f'{iteration}_{log_name}'), 'w') as f:
+                    json.dump(load_evaluation_log(os.path.join(folder, log_name)), f)
+                yield make_lazy_collapsable(f'{batch_data_url}/{iteration}_{log_name}', log_name, kind='log')
+    yield '</table>'
+
+
+def create_sidecar_script():
+    """
+        Loads the sidecar file of a lazy collapsable the first time it is opened.
+        Browsers do not fetch files from file:// pages, so split reports have to be served over HTTP.
+    """
+    return """
+    <script>
+    function renderCharts(target, data) {
+        data.charts.forEach(function (chart) {
+            var plot = document.createElement('div');
+            plot.id = 'plot_' + chart.id;
+            plot.style = 'width:100%;max-width:700px';
+            target.appendChild(plot);
+            Plotly.newPlot(plot.id, [{x: chart.x, y: chart.y, mode: "lines", type: "scatter"}], {
+                xaxis: {autorange: true, title: "Generation"},
+                yaxis: {autorange: true, title: "MCC Fitness"},
+                title: "Fitness Development"
+            });
+            var table = '<table class ="table"><tr><td>Generation</td>';
+            chart.full_x.forEach(function (x) { table += '<td>' + x + '</td>'; });
+            table += '</tr><tr><td>' + chart.title + '</td>';
+            chart.full_y.forEach(function (y) { table += '<td>' + y + '</td>'; });
+            target.insertAdjacentHTML('beforeend', '<details><summary>' + chart.title + ' (all generations): &#x25BC;' +
+                '</summary><div>' + table + '</tr></table></div></details>');
+        });
+    }
+
+    function renderLog(target, data) {
+        var pre = document.createElement('pre');
+        pre.textContent = JSON.stringify(data, null, 2);
+        target.appendChild(pre);
+    }
+
+    document.addEventListener('toggle', function (event) {
+        var details = event.target;
+        if (!details.open || !details.dataset.src || details.dataset.loaded) {
+            return;
+        }
+        details.dataset.loaded = 'true';
+        var target = details.querySelector('div');
+        target.textContent = 'Loading ' + details.dataset.src + ' ...';
+        fetch(details.dataset.src)
+            .then(function (response) { return response.json(); })
+            .then(function (data) {
+                target.textContent = '';
+                if (details.dataset.kind === 'log') {
+                    renderLog(target, data);
+                } else {
+                    renderCharts(target, data);
+                }
+            })
+            .catch(function (error) {
+                target.textContent = 'Could not load ' + details.dataset.src + ': ' + error;
+                delete details.dataset.loaded;
+            });
+    }, true);
+    </script>
+    """
 
 
 '''
 ================== Log ==================
 '''
-def create_html_log_section(folder):
-    html = '<h4>Log</h4>\n'
-    if not os.path.exists(folder):
-        return html + '<p>Empty</p>\n'
-    html_list_elements = ''
-    for file_name in os.listdir(folder):
+def create_html_log_section(folder, index=NO_INDEX):
+    yield '<h4>Log</h4>\n'
+    if not index.exists(folder):
+        yield '<p>Empty</p>\n'
+        return
+    yield '<ul>\n'
+    for file_name in index.listdir(folder):
         file_path = p_join(folder, file_name)
-        file_html = convert_file_to_html(file_path, ['.txt'])
-        html_list_elements += to_html_list_element(file_html)
-    return html + to_html_list(html_list_elements)
+        file_html = convert_file_to_html(file_path, ['.txt'], index)
+        yield to_html_list_element(file_html)
+    yield '</ul>\n'
 
 
 def create_style():
@@ -454,50 +776,288 @@ def create_html_head():
     return html_code
 
 
-def generate_html(source_path, target_path):
-    html_code = create_html_head()
+def create_html(source_path, cache_path=None, workers=1, svg_cache_path=None, data_path=None, index=None,
+                point_budget=CHART_POINT_BUDGET):
+    """
+        Yields the fragments of the whole report, one section at a time.
+        The results directory is scanned once up front, unless an index of it is given.
+        If cache_path is given, unchanged test batches are read from the render cache instead of being rendered again.
+        With more than one worker, the test batches are rendered in a process pool; the output stays the same.
+        If data_path is given, the analyzer data is written to sidecar files there instead of being inlined.
+        Fitness charts with more than point_budget points are downsampled (0 plots every generation).
+    """
+    if index is None:
+        index = ResultsIndex.scan(source_path)
+    fingerprints = None
+    if cache_path is not None:
+        fingerprints = {batch_name: batch_fingerprint(source_path, batch_name, data_path, index, point_budget)
+                        for batch_name in index.listdir(source_path)
+                        if index.isdir(p_join(source_path, batch_name))}
+        prune_render_cache(cache_path, fingerprints)
+
+    yield create_html_head()
+    if data_path is not None:
+        yield create_sidecar_script()
 
     # Insert Table of Contents
-    html_code += create_table_of_contents(source_path)
+    yield create_table_of_contents(source_path, cache_path, fingerprints, index)
 
-    for batch_name in os.listdir(source_path):
-        html_code += create_html_of_test_batch(source_path, batch_name)
-    html_code += '</div>\n</body>\n</html>'
-    with open(p_join(target_path, 'index.html'), 'w') as f:
-        f.write(html_code)
-        webbrowser.open(f.name)
+    if workers > 1:
+        yield from create_parallel_html_of_test_batches(source_path, index.listdir(source_path), workers,
+                                                        cache_path, fingerprints, svg_cache_path, data_path, index,
+                                                        point_budget)
+        yield '</div>\n</body>\n</html>'
+        return
 
+    for batch_name in index.listdir(source_path):
+        if cache_path is not None and batch_name in fingerprints:
+            yield from create_cached_html_of_test_batch(source_path, batch_name, cache_path, fingerprints[batch_name],
+                                                        svg_cache_path, data_path, index, point_budget)
+        else:
+            yield from create_html_of_test_batch(source_path, batch_name, svg_cache_path, data_path, index,
+                                                 point_budget)
+    yield '</div>\n</body>\n</html>'
 
-def create_html_of_test_batch(source_path, test_batch_name):
-    path = p_join(source_path, test_batch_name)
-    if not os.path.isdir(path):
-        return ''
 
-    # Loop through Folders and Create Report details
-    html_report_details = create_html_report_details(path, test_batch_name)
+'''
+================== Render Cache ==================
+'''
+def batch_fingerprint(source_path, batch_name, data_path=None, index=NO_INDEX, point_budget=CHART_POINT_BUDGET):
+    """
+        Hashes path, size and modification time of every file of a test batch.
+        The rendered markup also depends on the batch path, the working directory (relative image links), the
+        sidecar directory of split reports and the chart point budget, so these are part of the fingerprint.
+    """
+    batch_path = p_join(source_path, batch_name)
+    h = hashlib.sha1()
+    h.update(f'{RENDER_CACHE_VERSION}\n{batch_path}\n{os.getcwd()}\n{data_path}\n{point_budget}\n'.encode('utf-8'))
+    for root, dirs, files in index.walk(batch_path):
+        dirs.sort()
+        h.update(f'{os.path.relpath(root, batch_path)}/\n'.encode('utf-8'))
+        for file_name, size, mtime_ns in sorted(files):
+            h.update(f'{file_name}\t{size}\t{mtime_ns}\n'.encode('utf-8'))
+    return h.hexdigest()
 
-    html = f"""
+
+def get_cache_entry(cache_path, batch_name, fingerprint):
+    return p_join(cache_path, batch_name, fingerprint)
+
+
+def prune_render_cache(cache_path, fingerprints):
+    """
+        Removes cache entries of deleted test batches and outdated fingerprints.
+    """
+    if not os.path.exists(cache_path):
+        return
+    for batch_name in os.listdir(cache_path):
+        batch_cache = p_join(cache_path, batch_name)
+        if batch_name not in fingerprints:
+            shutil.rmtree(batch_cache, ignore_errors=True)
+            continue
+        for fingerprint in os.listdir(batch_cache):
+            if fingerprint != fingerprints[batch_name]:
+                shutil.rmtree(p_join(batch_cache, fingerprint), ignore_errors=True)
+
+
+def load_cached_summary(cache_path, batch_name, fingerprint):
+    summary_path = p_join(get_cache_entry(cache_path, batch_name, fingerprint), 'summary.json')
+    if not os.path.exists(summary_path):
+        return None
+    with open(summary_path) as f:
+        return json.load(f)
+
+
+def store_cached_summary(cache_path, batch_name, fingerprint, summary):
+    entry = get_cache_entry(cache_path, batch_name, fingerprint)
+    os.makedirs(entry, exist_ok=True)
+    with open(p_join(entry, 'summary.json'), 'w') as f:
+        json.dump(summary, f)
+
+
+def cached_fragment_path(entry, batch_name, data_path=None):
+    """
+        Path of the fragment in a cache entry, None if there is none or if it references sidecar files of the batch
+        that do not exist anymore.
+    """
+    fragment_path = p_join(entry, 'fragment.html')
+    if not os.path.exists(fragment_path):
+        return None
+    if (data_path is not None and os.path.exists(p_join(entry, SIDECAR_FLAG))
+            and not os.path.exists(p_join(data_path, batch_name))):
+        return None
+    return fragment_path
+
+
+def flag_sidecars(fragments, entry):
+    """
+        Passes the fragments through and marks the cache entry if they reference sidecar files.
+    """
+    references_sidecars = False
+    for fragment in fragments:
+        references_sidecars = references_sidecars or 'class="sidecar"' in fragment
+        yield fragment
+    if references_sidecars:
+        open(p_join(entry, SIDECAR_FLAG), 'w').close()
+
+
+def create_cached_html_of_test_batch(source_path, batch_name, cache_path, fingerprint, svg_cache_path=None,
+                                     data_path=None, index=NO_INDEX, point_budget=CHART_POINT_BUDGET):
+    """
+        Yields the cached fragment of a test batch, or renders it while writing it to the cache.
+        The fragment is only committed to the cache after it was rendered completely.
+    """
+    entry = get_cache_entry(cache_path, batch_name, fingerprint)
+    cached_path = cached_fragment_path(entry, batch_name, data_path)
+    if cached_path is not None:
+        yield from read_fragments(cached_path)
+        return
+
+    os.makedirs(entry, exist_ok=True)
+    fragment_path = p_join(entry, 'fragment.html')
+    tmp_path = fragment_path + '.tmp'
+    with open(tmp_path, 'w', buffering=WRITE_BUFFER_SIZE) as f:
+        for fragment in flag_sidecars(create_html_of_test_batch(source_path, batch_name, svg_cache_path, data_path,
+                                                                index, point_budget), entry):
+            f.write(fragment)
+            yield fragment
+    os.replace(tmp_path, fragment_path)
+
+
+'''
+================== Parallel Rendering ==================
+'''
+def render_html_of_test_batch(source_path, batch_name, fragment_path, svg_cache_path=None, data_path=None,
+                              index=NO_INDEX, point_budget=CHART_POINT_BUDGET, entry=None):
+    """
+        Renders a test batch into fragment_path. Runs in a worker process.
+        If fragment_path belongs to the cache entry entry, the entry is marked when the fragment references sidecars.
+    """
+    tmp_path = fragment_path + '.tmp'
+    fragments = create_html_of_test_batch(source_path, batch_name, svg_cache_path, data_path, index, point_budget)
+    write_fragments(flag_sidecars(fragments, entry) if entry is not None else fragments, tmp_path)
+    os.replace(tmp_path, fragment_path)
+    return fragment_path
+
+
+def create_parallel_html_of_test_batches(source_path, batch_names, workers, cache_path=None, fingerprints=None,
+                                         svg_cache_path=None, data_path=None, index=NO_INDEX,
+                                         point_budget=CHART_POINT_BUDGET):
+    """
+        Renders test batches in a pool of worker processes and yields their fragments in the order of batch_names.
+        Each batch is rendered into its own file (the cache entry, if a cache is used), which is streamed as soon as
+        all batches before it are done. Workers only get the index of their own batch.
+    """
+    batch_names = [b for b in batch_names if index.isdir(p_join(source_path, b))]
+    with tempfile.TemporaryDirectory() as tmp_dir, ProcessPoolExecutor(max_workers=workers) as executor:
+        jobs = []
+        for i, batch_name in enumerate(batch_names):
+            entry = None
+            if cache_path is not None:
+                entry = get_cache_entry(cache_path, batch_name, fingerprints[batch_name])
+                cached_path = cached_fragment_path(entry, batch_name, data_path)
+                if cached_path is not None:
+                    jobs.append((cached_path, None))
+                    continue
+                os.makedirs(entry, exist_ok=True)
+                fragment_path = p_join(entry, 'fragment.html')
+            else:
+                fragment_path = p_join(tmp_dir, f'{i}.html')
+            jobs.append((fragment_path,
+                         executor.submit(render_html_of_test_batch, source_path, batch_name, fragment_path,
+                                         svg_cache_path, data_path, index.subindex(p_join(source_path, batch_name)),
+                                         point_budget, entry)))
+
+        for fragment_path, future in jobs:
+            if future is not None:
+                future.result()
+            yield from read_fragments(fragment_path)
+            if cache_path is None:
+                os.remove(fragment_path)
+
+
+def write_fragments(fragments, file_path, buffer_size=WRITE_BUFFER_SIZE):
+    """
+        Streams fragments into file_path through a buffered writer, so only one fragment is held in memory at a time.
+    """
+    with open(file_path, 'w', buffering=buffer_size) as f:
+        for fragment in fragments:
+            f.write(fragment)
+    return file_path
+
+
+def read_fragments(file_path, chunk_size=WRITE_BUFFER_SIZE):
+    with open(file_path, 'r') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def generate_html(source_path, target_path, cache_path=None, workers=1, svg_cache_path=None, split=False, index=None,
+                  point_budget=CHART_POINT_BUDGET):
+    data_path = p_join(target_path, SIDECAR_DIR) if split else None
+    index_path = write_fragments(create_html(source_path, cache_path, workers, svg_cache_path, data_path, index,
+                                             point_budget),
+                                 p_join(target_path, 'index.html'))
+    webbrowser.open(index_path)
+
+
+def create_html_of_test_batch(source_path, test_batch_name, svg_cache_path=None, data_path=None, index=NO_INDEX,
+                              point_budget=CHART_POINT_BUDGET):
+    path = p_join(source_path, test_batch_name)
+    if not index.isdir(path):
+        return
+
+    yield f"""
         <h2 id="series{test_batch_name}">Testseries of {test_batch_name}</h2>
         <button class="btn btn-primary" type="button" data-toggle="collapse" data-target="#{test_batch_name}" aria-expanded="false" aria-controls="{test_batch_name}">Show</button>
         </h2>
         <div class="collapse" id="{test_batch_name}">
         <div class="card card-body">
-        {html_report_details}
+        """
+
+    # Loop through Folders and Create Report details
+    yield from create_html_report_details(path, test_batch_name, svg_cache_path, data_path, index, point_budget)
+
+    yield """
         </div></div><hr/>        
     """
 
-    return html
-
 
-def create_report():
+def create_report(use_cache=True, workers=1, split=False, reuse_index=False, point_budget=CHART_POINT_BUDGET):
     results_path = p_join(os.path.curdir, 'results')
     report_path = p_join(os.path.curdir, 'report')
 
     os.makedirs(report_path, mode=777, exist_ok=True)
 
     # Creates HTML file report/index.html
-    generate_html(results_path, report_path)
+    cache_path = p_join(report_path, RENDER_CACHE_DIR) if use_cache else None
+    svg_cache_path = p_join(report_path, SVG_CACHE_DIR) if use_cache else None
+    # Scans results once; with reuse_index only directories that changed since the last report are listed
+    index = update_index(results_path, p_join(report_path, RESULTS_INDEX_FILE), reuse_index)
+    generate_html(results_path, report_path, cache_path, workers, svg_cache_path, split, index, point_budget)
 
 
 if __name__ == '__main__':
-    create_report()
+    parser = argparse.ArgumentParser(description='Creates report/index.html from the test batches in results')
+    parser.add_argument('--no-cache', action='store_true',
+                        help=f'render every test batch and pipeline graph again instead of reusing '
+                             f'report/{RENDER_CACHE_DIR} and report/{SVG_CACHE_DIR}')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes rendering test batches in parallel, 0 uses all cores '
+                             '(default: 1, renders serially)')
+    parser.add_argument('--split', action='store_true',
+                        help=f'write the analyzer data of each run to report/{SIDECAR_DIR} and load it only when its '
+                             f'section is expanded; the report then has to be served over HTTP, '
+                             f'e.g. python -m http.server --directory report')
+    parser.add_argument('--reuse-index', action='store_true',
+                        help=f'scan results incrementally based on report/{RESULTS_INDEX_FILE} of the last run; '
+                             f'files that were modified in place since then are not detected')
+    parser.add_argument('--chart-points', type=chart_points, default=CHART_POINT_BUDGET,
+                        help=f'maximum number of points per fitness chart, longer curves are downsampled keeping the '
+                             f'minimum and maximum of every bucket; 0 plots every generation '
+                             f'(default: {CHART_POINT_BUDGET})')
+    args = parser.parse_args()
+    create_report(use_cache=not args.no_cache, workers=args.workers or os.cpu_count(), split=args.split,
+                  reuse_index=args.reuse_index, point_budget=args.chart_points)
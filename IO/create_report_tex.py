@@ -1,24 +1,25 @@
 import os
 from datetime import datetime
 from os.path import join as p_join
+from results_index import NO_INDEX, RESULTS_INDEX_FILE, update_index
 
 
-def create_tex_list(path):
+def create_tex_list(path, index=NO_INDEX):
     tex = '\\begin{itemize}\n'
-    for dirname in os.listdir(path):
+    for dirname in index.listdir(path):
         tex = tex + '\item ' + dirname + '\n'
     tex = tex + '\end{itemize}\n'
     return tex
 
 
-def create_tex_report_details(path):
+def create_tex_report_details(path, index=NO_INDEX):
     tex = ''
-    for dirname in os.listdir(path):
+    for dirname in index.listdir(path):
         tex = tex + '\subsection*{Report ' + dirname + '}\n\n'
         tex = tex + '\paragraph{Analyzer}\n'
         analyzer_path = p_join(path, dirname, 'Analyzer')
-        if os.path.exists(analyzer_path):
-            tex = tex + create_tex_list(analyzer_path) + '\n\n'
+        if index.exists(analyzer_path):
+            tex = tex + create_tex_list(analyzer_path, index) + '\n\n'
         else:
             tex = tex + '\\textbf{Empty}\n\n'
 
@@ -30,21 +31,21 @@ def create_tex_report_details(path):
 
         tex = tex + '\paragraph{Grid}\n'
         grid_path = p_join(path, dirname, 'Grid')
-        if os.path.exists(grid_path):
-            tex = tex + create_tex_list(grid_path) + '\n\n'
+        if index.exists(grid_path):
+            tex = tex + create_tex_list(grid_path, index) + '\n\n'
         else:
             tex = tex + '\\textbf{Empty}\n\n'
 
         tex = tex + '\paragraph{Images}\n'
         images_path = p_join(path, dirname, 'Images')
-        if os.path.exists(images_path):
-            tex = tex + create_tex_list(images_path) + '\n\n'
+        if index.exists(images_path):
+            tex = tex + create_tex_list(images_path, index) + '\n\n'
         else:
             tex = tex + '\\textbf{Empty}\n\n'
 
         tex = tex + '\paragraph{Log}\n'
         log_path = p_join(path, dirname, 'Log', 'date.txt')
-        if os.path.exists(log_path):
+        if index.exists(log_path):
             f = open(log_path, 'r')
             tex = tex + '\\textbf{' + f.read() + '}\n\n'
         else:
@@ -53,12 +54,12 @@ def create_tex_report_details(path):
     return tex
 
 
-def generate_tex(source_path, target_path):
+def generate_tex(source_path, target_path, index=NO_INDEX):
     tex_code = '\section*{PyCGP-SP Report ' + datetime.now().strftime('%m/%d/%Y, %H:%M:%S') + '}'
     """
     Loop through Folders and Create Report details
     """
-    tex_code = tex_code + create_tex_report_details(source_path)
+    tex_code = tex_code + create_tex_report_details(source_path, index)
     f = open(p_join(target_path, 'report.tex'), 'w')
     f.write(tex_code)
     f.close()
@@ -70,8 +71,11 @@ def create_report():
 
     os.makedirs(report_path, mode=777, exist_ok=True)
 
+    # Shares the results index with create_report_html.py
+    index = update_index(results_path, p_join(report_path, RESULTS_INDEX_FILE))
+
     # Creates HTML file report/report.tex
-    generate_tex(results_path, report_path) # TODO Implement tex generation and activate it
+    generate_tex(results_path, report_path, index) # TODO Implement tex generation and activate it
 
 
 if __name__ == '__main__':
@@ -0,0 +1,87 @@
+import json
+import os
+
+"""
+JSON loading for the report generators.
+
+Files are parsed with orjson if it is installed, else with json. Files above STREAMING_THRESHOLD are parsed
+incrementally with ijson (if installed), one array item or generation at a time, so the evaluation logs written with
+fitness memoization never have to be held as a whole. Records are reduced to the fields the reports need.
+"""
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Files larger than this are streamed, if ijson is installed
+STREAMING_THRESHOLD = 32 * 1024 * 1024
+# Fields of the evaluation log entries (individual_evaluation_log.json, loader_evaluation_log.json) used by the reports
+EVALUATION_LOG_FIELDS = ['Fitness', 'FitnessValues']
+
+
+def load_json(file_path):
+    if orjson is not None:
+        with open(file_path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(file_path, 'r') as f:
+        return json.load(f)
+
+
+def is_streamed(file_path):
+    return ijson is not None and os.path.getsize(file_path) > STREAMING_THRESHOLD
+
+
+def project(record, fields):
+    """
+        Reduces record to fields. A field is a key or a tuple of keys into nested objects, e.g. ('Fitness', 'MCC').
+        Missing fields are left out.
+    """
+    if fields is None or not isinstance(record, dict):
+        return record
+    projection = {}
+    for field in fields:
+        path = field if isinstance(field, tuple) else (field,)
+        value = record
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = projection
+            for key in path[:-1]:
+                target = target.setdefault(key, {})
+            target[path[-1]] = value
+    return projection
+
+
+def load_records(file_path, fields=None):
+    """
+        Items of the top level array in file_path, reduced to fields.
+    """
+    if is_streamed(file_path):
+        with open(file_path, 'rb') as f:
+            return [project(item, fields) for item in ijson.items(f, 'item', use_float=True)]
+    return [project(item, fields) for item in load_json(file_path)]
+
+
+def load_evaluation_log(file_path, fields=EVALUATION_LOG_FIELDS):
+    """
+        Evaluation log {generation: entry or [entries]} with every entry reduced to fields.
+    """
+    if is_streamed(file_path):
+        with open(file_path, 'rb') as f:
+            items = ijson.kvitems(f, '', use_float=True)
+            return {generation: project_entries(entries, fields) for generation, entries in items}
+    return {generation: project_entries(entries, fields) for generation, entries in load_json(file_path).items()}
+
+
+def project_entries(entries, fields):
+    if isinstance(entries, list):
+        return [project(entry, fields) for entry in entries]
+    return project(entries, fields)
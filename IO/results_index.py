@@ -0,0 +1,183 @@
+import json
+import os
+from os.path import join as p_join
+
+"""
+Index of the results directory (IO/results), built in a single os.scandir pass and shared by the report generators.
+
+Every directory is stored as {'mtime_ns': ..., 'entries': {name: ...}} where an entry is either a directory of the
+same form or a file as [size, mtime_ns]. Entries keep the order of the directory listing, so the reports come out
+the same as with os.listdir.
+
+The index can be saved as JSON and passed as previous index to a later scan: directories whose mtime did not change
+are not listed again, only their sub directories are checked. Files that are modified in place (no file added,
+removed or renamed in their directory) are therefore not picked up by an incremental scan.
+"""
+
+INDEX_VERSION = 1
+RESULTS_INDEX_FILE = '.results_index.json'
+
+
+def scan_directory(path, previous=None, mtime_ns=None):
+    if mtime_ns is None:
+        mtime_ns = os.stat(path).st_mtime_ns
+    entries = {}
+    if previous is not None and previous['mtime_ns'] == mtime_ns:
+        for name, entry in previous['entries'].items():
+            if isinstance(entry, dict):
+                entries[name] = scan_directory(p_join(path, name), entry)
+            else:
+                entries[name] = entry
+        return {'mtime_ns': mtime_ns, 'entries': entries}
+
+    with os.scandir(path) as it:
+        for entry in it:
+            st = entry.stat()
+            if entry.is_dir():
+                previous_entry = previous['entries'].get(entry.name) if previous is not None else None
+                if not isinstance(previous_entry, dict):
+                    previous_entry = None
+                entries[entry.name] = scan_directory(entry.path, previous_entry, st.st_mtime_ns)
+            else:
+                entries[entry.name] = [st.st_size, st.st_mtime_ns]
+    return {'mtime_ns': mtime_ns, 'entries': entries}
+
+
+class ResultsIndex:
+    """
+        Answers listdir/exists/isdir/stat/walk queries for paths below root from the index instead of the file system.
+        Paths outside of root are passed on to os, as are all queries of NO_INDEX.
+    """
+
+    def __init__(self, root, tree):
+        self.root = root
+        self.tree = tree
+
+    @classmethod
+    def scan(cls, root, previous=None):
+        previous_tree = None
+        if previous is not None and os.path.abspath(previous.root) == os.path.abspath(root):
+            previous_tree = previous.tree
+        return cls(root, scan_directory(root, previous_tree))
+
+    @classmethod
+    def load(cls, file_path):
+        with open(file_path, 'r') as f:
+            data = json.load(f)
+        if data.get('version') != INDEX_VERSION:
+            return None
+        return cls(data['root'], data['tree'])
+
+    def save(self, file_path):
+        tmp_path = file_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': INDEX_VERSION, 'root': self.root, 'tree': self.tree}, f)
+        os.replace(tmp_path, file_path)
+
+    def _parts(self, path):
+        if self.root is None:
+            return None
+        rel_path = os.path.relpath(path, self.root)
+        if rel_path == os.curdir:
+            return []
+        if rel_path == os.pardir or rel_path.startswith(os.pardir + os.sep) or os.path.isabs(rel_path):
+            return None
+        return rel_path.split(os.sep)
+
+    def _lookup(self, path):
+        """
+            Returns (True, entry) for paths below root, entry being None if it does not exist,
+            and (False, None) for paths outside of root.
+        """
+        parts = self._parts(path)
+        if parts is None:
+            return False, None
+        entry = self.tree
+        for part in parts:
+            if not isinstance(entry, dict) or part not in entry['entries']:
+                return True, None
+            entry = entry['entries'][part]
+        return True, entry
+
+    def subindex(self, path):
+        """
+            Index rooted at the directory path, e.g. a single test batch that is handed to a worker process.
+        """
+        indexed, entry = self._lookup(path)
+        if not indexed:
+            return ResultsIndex.scan(path)
+        if not isinstance(entry, dict):
+            raise NotADirectoryError(path)
+        return ResultsIndex(path, entry)
+
+    def listdir(self, path):
+        indexed, entry = self._lookup(path)
+        if not indexed:
+            return os.listdir(path)
+        if entry is None:
+            raise FileNotFoundError(path)
+        if not isinstance(entry, dict):
+            raise NotADirectoryError(path)
+        return list(entry['entries'])
+
+    def exists(self, path):
+        indexed, entry = self._lookup(path)
+        if not indexed:
+            return os.path.exists(path)
+        return entry is not None
+
+    def isdir(self, path):
+        indexed, entry = self._lookup(path)
+        if not indexed:
+            return os.path.isdir(path)
+        return isinstance(entry, dict)
+
+    def stat(self, path):
+        """
+            (size, mtime_ns) of the file path.
+        """
+        indexed, entry = self._lookup(path)
+        if not indexed:
+            st = os.stat(path)
+            return st.st_size, st.st_mtime_ns
+        if entry is None:
+            raise FileNotFoundError(path)
+        if isinstance(entry, dict):
+            raise IsADirectoryError(path)
+        return entry[0], entry[1]
+
+    def walk(self, path):
+        """
+            Same as os.walk(path), with files given as (name, size, mtime_ns).
+        """
+        indexed, entry = self._lookup(path)
+        if not indexed:
+            for root, dirs, files in os.walk(path):
+                stats = [(f, os.stat(p_join(root, f))) for f in files]
+                yield root, dirs, [(f, st.st_size, st.st_mtime_ns) for f, st in stats]
+            return
+        if not isinstance(entry, dict):
+            return
+        dirs = [name for name, e in entry['entries'].items() if isinstance(e, dict)]
+        files = [(name, e[0], e[1]) for name, e in entry['entries'].items() if not isinstance(e, dict)]
+        yield path, dirs, files
+        for name in dirs:
+            yield from self.walk(p_join(path, name))
+
+
+# Passes every query on to os
+NO_INDEX = ResultsIndex(None, None)
+
+
+def update_index(results_path, index_file=None, reuse=False):
+    """
+        Scans results_path and saves the index to index_file (if given).
+        With reuse, the index saved in index_file before is used for an incremental scan.
+    """
+    previous = None
+    if reuse and index_file is not None and os.path.exists(index_file):
+        previous = ResultsIndex.load(index_file)
+    index = ResultsIndex.scan(results_path, previous)
+    if index_file is not None:
+        index.save(index_file)
+    return index
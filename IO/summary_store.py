@@ -0,0 +1,187 @@
+import argparse
+import os
+from os.path import join as p_join
+import numpy as np
+from json_loader import load_records
+from results_index import NO_INDEX
+
+"""
+Compacts the per run fitness logs of test batches into one columnar file per batch, written next to the batch as
+summary.npz (and summary.parquet, if pyarrow is installed). The report and the comparison scripts read these files
+instead of walking the Analyzer directories, if they exist.
+
+Each row is one generation of one run:
+
+    batch, run, generation, best_fitness, avg_population_fitness, avg_offspring_fitness
+
+Missing values are NaN. summary.npz also holds one entry per record of overview.json, in the order of the file:
+
+    iteration, iteration_mcc
+
+iteration_mcc is the MCC of the best individual of the record (NaN if missing). The iterations of overview.json count
+the runs in the order they finished, not the Analyzer/<k> runs, so the MCCs are not joined to the rows.
+
+Usage: python summary_store.py [results_dir]
+Every directory below results_dir (default: ./results) that contains an Analyzer directory is compacted.
+"""
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+SUMMARY_NPZ = 'summary.npz'
+SUMMARY_PARQUET = 'summary.parquet'
+# Column -> (analyzer file, value field) of the fitness curves
+CURVES = {
+    'best_fitness': ('BestIndividualFit', 'BestIndividualFitness'),
+    'avg_population_fitness': ('AvgPopulationFit', 'AveragePopulationFitness'),
+    'avg_offspring_fitness': ('AvgOffspringFit', 'AverageOffspringFitness')
+}
+COLUMNS = ['batch', 'run', 'generation'] + list(CURVES)
+# Per record of overview.json, only in summary.npz
+ITERATION_COLUMNS = ['iteration', 'iteration_mcc']
+
+
+def read_curve(run_path, file_name, field):
+    """
+        Generations and values of an analyzer curve, read from its json file or else its txt (csv) file.
+    """
+    json_path = p_join(run_path, file_name + '.json')
+    if os.path.exists(json_path):
+        records = load_records(json_path, ['Generation', field])
+        generations = np.array([r['Generation'] for r in records], dtype=np.int64)
+        values = np.array([r[field] for r in records], dtype=np.float64)
+        return generations, values
+    txt_path = p_join(run_path, file_name + '.txt')
+    if os.path.exists(txt_path):
+        data = np.loadtxt(txt_path, delimiter=',', skiprows=1, ndmin=2)
+        return data[:, 0].astype(np.int64), data[:, 1]
+    return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+
+def read_iteration_mccs(batch_path):
+    """
+        Iteration numbers and MCCs of the records of overview.json.
+    """
+    overview_path = p_join(batch_path, 'overview.json')
+    if not os.path.exists(overview_path):
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    records = load_records(overview_path, ['Iteration', ('Fitness', 'MCC')])
+    iterations = [record.get('Iteration', k) for k, record in enumerate(records)]
+    mccs = [record.get('Fitness', {}).get('MCC') for record in records]
+    return (np.array(iterations, dtype=np.int64),
+            np.array([np.nan if mcc is None else mcc for mcc in mccs], dtype=np.float64))
+
+
+def compact_batch(batch_path, batch_name=None):
+    """
+        Builds the summary columns of the test batch in batch_path.
+    """
+    batch_name = batch_name or os.path.basename(os.path.normpath(batch_path))
+    analyzer_path = p_join(batch_path, 'Analyzer')
+    runs = sorted(int(d) for d in os.listdir(analyzer_path) if d.lstrip('-').isdigit())
+    columns = {c: [] for c in COLUMNS}
+    for run in runs:
+        curves = {c: read_curve(p_join(analyzer_path, str(run)), *CURVES[c]) for c in CURVES}
+        generations = np.unique(np.concatenate([g for g, _ in curves.values()]))
+        columns['run'].append(np.full(len(generations), run, dtype=np.int64))
+        columns['generation'].append(generations)
+        for c, (curve_generations, values) in curves.items():
+            column = np.full(len(generations), np.nan)
+            column[np.searchsorted(generations, curve_generations)] = values
+            columns[c].append(column)
+    summary = {c: np.concatenate(columns[c]) if columns[c] else np.zeros(0) for c in COLUMNS if c != 'batch'}
+    summary['run'] = summary['run'].astype(np.int64)
+    summary['generation'] = summary['generation'].astype(np.int64)
+    summary['batch'] = np.full(len(summary['run']), batch_name)
+    summary['iteration'], summary['iteration_mcc'] = read_iteration_mccs(batch_path)
+    return {c: summary[c] for c in COLUMNS + ITERATION_COLUMNS}
+
+
+def write_summary(batch_path, summary):
+    tmp_path = p_join(batch_path, SUMMARY_NPZ + '.tmp.npz')
+    np.savez(tmp_path, **summary)
+    os.replace(tmp_path, p_join(batch_path, SUMMARY_NPZ))
+    if pyarrow is not None:
+        table = pyarrow.table({c: summary[c].tolist() if c == 'batch' else summary[c] for c in COLUMNS})
+        pyarrow.parquet.write_table(table, p_join(batch_path, SUMMARY_PARQUET))
+
+
+def load_summary(batch_path, min_mtime_ns=None):
+    """
+        Summary columns of a test batch, or None if it was not compacted, its summary is older than min_mtime_ns or
+        was written by an older version without the overview columns.
+    """
+    npz_path = p_join(batch_path, SUMMARY_NPZ)
+    try:
+        if min_mtime_ns is not None and os.stat(npz_path).st_mtime_ns < min_mtime_ns:
+            return None
+        with np.load(npz_path) as data:
+            if any(c not in data.files for c in ITERATION_COLUMNS):
+                return None
+            return {c: data[c] for c in COLUMNS + ITERATION_COLUMNS}
+    except FileNotFoundError:
+        return None
+
+
+def newest_source_mtime_ns(batch_path, index=NO_INDEX):
+    """
+        Newest modification time of the files a summary is built from (the analyzer logs and overview.json), None if
+        there are none. Files are looked up in index, the file system by default.
+    """
+    source_mtimes = [mtime_ns for _, _, files in index.walk(p_join(batch_path, 'Analyzer')) for _, _, mtime_ns in files]
+    overview_path = p_join(batch_path, 'overview.json')
+    if index.exists(overview_path):
+        source_mtimes.append(index.stat(overview_path)[1])
+    return max(source_mtimes, default=None)
+
+
+def load_current_summary(batch_path, index=NO_INDEX):
+    """
+        Summary columns of a test batch, or None if it was not compacted or its summary is older than its sources.
+    """
+    if not index.exists(p_join(batch_path, SUMMARY_NPZ)):
+        return None
+    return load_summary(batch_path, newest_source_mtime_ns(batch_path, index))
+
+
+def run_curve(summary, run, column):
+    """
+        Generations and values of one run, without the generations missing in column.
+    """
+    rows = (summary['run'] == run) & ~np.isnan(summary[column])
+    return summary['generation'][rows], summary[column][rows]
+
+
+def iteration_mccs(summary):
+    """
+        (iteration, MCC) of every record of overview.json in the order of the file, MCC being None if it is missing.
+    """
+    return [(iteration, None if np.isnan(mcc) else mcc)
+            for iteration, mcc in zip(summary['iteration'].tolist(), summary['iteration_mcc'].tolist())]
+
+
+def find_batches(path):
+    """
+        All directories below path (including path) containing an Analyzer directory.
+    """
+    for root, dirs, files in os.walk(path):
+        if 'Analyzer' in dirs:
+            yield root
+            dirs[:] = []
+
+
+def compact_results(results_path):
+    for batch_path in find_batches(results_path):
+        write_summary(batch_path, compact_batch(batch_path))
+        print(f'compacted {batch_path}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=f'Writes {SUMMARY_NPZ} (and {SUMMARY_PARQUET}) into every test batch')
+    parser.add_argument('results_dir', nargs='?', default=p_join(os.path.curdir, 'results'),
+                        help='directory containing the test batches')
+    args = parser.parse_args()
+    compact_results(args.results_dir)
@@ -0,0 +1,198 @@
+"""
+Runs the cells of an experiment matrix (like the loops of evias_experiment.sh) and records their runtime.
+
+The matrix is a JSON file:
+
+    {
+        "command": "docker run --network=host --rm -v evias:/evias localhost:5000/cgp batch --runs={runs} ...
+                    --results-dir={results_dir} --fit-func={fitness}",
+        "results_dir": "/evias/script_results/{data}_{operators}_{fitness}",
+        "local_results_dir": "/var/lib/docker/volumes/evias/_data/script_results/{data}_{operators}_{fitness}",
+        "parameters": {"runs": 30, "generations": 200},
+        "matrix": {"fitness": ["IntersectionOverUnion", "MCC"], "operators": ["laplace", "fast"], ...}
+    }
+
+Every combination of the matrix values is one cell. The templates are filled with the cell values, the parameters and
+results_dir. local_results_dir (default: results_dir) is where the results of a cell can be read on this machine,
+it is used to count the individual evaluations of the cell (Analyzer/<k>/individual_evaluation_log.json).
+
+For each cell the wall time, the CPU time (user + system) and the peak RSS of the child process are recorded. These
+are taken from wait4, so they cover the command and the descendants it waited for; for docker run that is only the
+docker client, run the CLI directly (e.g. mono Optimization.Commandline.exe batch ...) to measure the optimization.
+The command is started from a small launcher process (MEASURE_SCRIPT), because a child forked from this process would
+report the resident memory of this process at the time of the fork as its peak RSS.
+
+Usage:
+    python benchmark_matrix.py run matrix.json output_dir [--label COMMIT] [--concurrency N]
+    python benchmark_matrix.py compare benchmark_A.csv benchmark_B.csv
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import shlex
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join as p_join
+
+sys.path.insert(0, p_join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'IO'))
+from json_loader import load_evaluation_log
+
+# Runs the command sys.argv[2:] and writes its exit code and resource usage to the JSON file sys.argv[1]
+MEASURE_SCRIPT = """
+import json, os, subprocess, sys, time
+start = time.perf_counter()
+process = subprocess.Popen(sys.argv[2:])
+_, status, usage = os.wait4(process.pid, 0)
+wall = time.perf_counter() - start
+with open(sys.argv[1], 'w') as f:
+    json.dump({'returncode': os.waitstatus_to_exitcode(status), 'wall_s': wall,
+               'cpu_s': usage.ru_utime + usage.ru_stime, 'maxrss': usage.ru_maxrss}, f)
+"""
+RESULT_COLUMNS = ['label', 'cell', 'returncode', 'wall_s', 'cpu_s', 'peak_rss_mb', 'evaluations',
+                  'evaluations_per_s']
+
+
+def load_matrix(file_path):
+    with open(file_path, 'r') as f:
+        return json.load(f)
+
+
+def expand_matrix(matrix):
+    """
+        One dict of values per cell: the parameters and one value of every matrix dimension, plus results_dir and
+        local_results_dir filled with these values. Cells are ordered like nested loops over the dimensions.
+    """
+    dimensions = list(matrix['matrix'])
+    cells = []
+    for values in itertools.product(*(matrix['matrix'][d] for d in dimensions)):
+        cell = dict(matrix.get('parameters', {}))
+        cell.update(zip(dimensions, values))
+        cell['results_dir'] = matrix['results_dir'].format(**cell)
+        cell['local_results_dir'] = matrix.get('local_results_dir', matrix['results_dir']).format(**cell)
+        cell['name'] = '_'.join(str(v) for v in values)
+        cells.append(cell)
+    return cells
+
+
+def cell_command(matrix, cell):
+    return shlex.split(matrix['command'].format(**cell))
+
+
+def count_evaluations(results_dir):
+    """
+        Number of individual evaluations logged in all runs of a batch, None if there are no logs.
+    """
+    analyzer_path = p_join(results_dir, 'Analyzer')
+    if not os.path.isdir(analyzer_path):
+        return None
+    evaluations = None
+    for run in os.listdir(analyzer_path):
+        log_path = p_join(analyzer_path, run, 'individual_evaluation_log.json')
+        if not os.path.exists(log_path):
+            continue
+        log = load_evaluation_log(log_path, fields=[])
+        evaluations = (evaluations or 0) + sum(len(e) if isinstance(e, list) else 1 for e in log.values())
+    return evaluations
+
+
+def run_measured(command, log_path):
+    """
+        Runs command with its output written to log_path.
+        Returns (returncode, wall time in s, CPU time in s, peak RSS in MB) of the child process.
+    """
+    usage_path = log_path + '.usage.json'
+    with open(log_path, 'w') as log:
+        launcher = subprocess.run([sys.executable, '-c', MEASURE_SCRIPT, usage_path] + command,
+                                  stdout=log, stderr=subprocess.STDOUT)
+    if not os.path.exists(usage_path):
+        return launcher.returncode, None, None, None
+    with open(usage_path, 'r') as f:
+        usage = json.load(f)
+    os.remove(usage_path)
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak_rss_mb = usage['maxrss'] / 1024 if sys.platform != 'darwin' else usage['maxrss'] / 1024 / 1024
+    return usage['returncode'], usage['wall_s'], usage['cpu_s'], peak_rss_mb
+
+
+def benchmark_cell(matrix, cell, log_dir, label=''):
+    command = cell_command(matrix, cell)
+    print(f'start {cell["name"]}: {shlex.join(command)}', flush=True)
+    returncode, wall, cpu, peak_rss_mb = run_measured(command, p_join(log_dir, cell['name'] + '.log'))
+    evaluations = count_evaluations(cell['local_results_dir'])
+    print(f'done {cell["name"]}: exit {returncode}', flush=True)
+    return {
+        'label': label,
+        'cell': cell['name'],
+        'returncode': returncode,
+        'wall_s': None if wall is None else round(wall, 3),
+        'cpu_s': None if cpu is None else round(cpu, 3),
+        'peak_rss_mb': None if peak_rss_mb is None else round(peak_rss_mb, 1),
+        'evaluations': evaluations,
+        'evaluations_per_s': None if evaluations is None or not wall else round(evaluations / wall, 3)
+    }
+
+
+def run_benchmark(matrix, output_dir, label='', concurrency=1):
+    """
+        Runs all cells, concurrency at a time, and writes benchmark_<label>.csv into output_dir.
+        Returns the path of the table.
+    """
+    log_dir = p_join(output_dir, 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+    cells = expand_matrix(matrix)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        rows = list(executor.map(lambda cell: benchmark_cell(matrix, cell, log_dir, label), cells))
+    table_path = p_join(output_dir, f'benchmark_{label}.csv' if label else 'benchmark.csv')
+    write_table(rows, table_path)
+    return table_path
+
+
+def write_table(rows, file_path):
+    with open(file_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def read_table(file_path):
+    with open(file_path, 'r', newline='') as f:
+        return {row['cell']: row for row in csv.DictReader(f)}
+
+
+def compare_tables(file_path_a, file_path_b, columns=('wall_s', 'cpu_s', 'peak_rss_mb', 'evaluations_per_s')):
+    """
+        Prints the ratio B/A of the columns for every cell of both tables.
+    """
+    a, b = read_table(file_path_a), read_table(file_path_b)
+    print('cell\t' + '\t'.join(f'{c} B/A' for c in columns))
+    for cell in a:
+        if cell not in b:
+            continue
+        ratios = []
+        for c in columns:
+            try:
+                ratios.append(f'{float(b[cell][c]) / float(a[cell][c]):.3f}')
+            except (ValueError, ZeroDivisionError):
+                ratios.append('-')
+        print(cell + '\t' + '\t'.join(ratios))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the cells of an experiment matrix')
+    commands = parser.add_subparsers(dest='mode', required=True)
+    run_parser = commands.add_parser('run', help='run all cells of a matrix and write the results table')
+    run_parser.add_argument('matrix', help='matrix JSON file, see evias_matrix.json')
+    run_parser.add_argument('output_dir', help='directory of the results table and the logs of the cells')
+    run_parser.add_argument('--label', default='', help='label of the results, e.g. the commit hash')
+    run_parser.add_argument('--concurrency', type=int, default=1, help='number of cells run at once (default: 1)')
+    compare_parser = commands.add_parser('compare', help='compare two results tables')
+    compare_parser.add_argument('table_a')
+    compare_parser.add_argument('table_b')
+    args = parser.parse_args()
+    if args.mode == 'run':
+        print(run_benchmark(load_matrix(args.matrix), args.output_dir, args.label, args.concurrency))
+    else:
+        compare_tables(args.table_a, args.table_b)
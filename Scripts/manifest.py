@@ -0,0 +1,151 @@
+"""
+Manifests of dataset splits (train_test_split.py): one JSON file that lists the image/label pairs of every split, so
+the dataset is stored once and a new subset is a new list instead of a new directory tree.
+
+    {
+        "version": 1,
+        "seed": 1234,
+        "parameters": {"stratify": "foreground", ...},
+        "root": "/evias/eval_data/dataset",
+        "splits": {
+            "train": [["images/a.png", "labels/a.png"], ...],
+            "val": [...],
+            "test": [...],
+            "train_experiment/5/0/train": [...]
+        }
+    }
+
+The paths are relative to root, the dataset directory; --root reads a dataset that was moved.
+
+The optimizer reads data directories in images/labels format (--train-data-dir, --val-data-dir). run builds such a
+directory of links for every split named in the command, runs the command with {<split>} replaced by the directory
+of the split and removes the directories afterwards:
+
+    python manifest.py run split/manifest.json -- mono Optimization.Commandline.exe batch \\
+        --train-data-dir={train_experiment/5/0/train} --val-data-dir={val} ...
+
+In a matrix of benchmark_matrix.py / schedule_matrix.py the braces of the splits are doubled, because the command is
+filled with the cell values first: --train-data-dir={{train_experiment/{size}/{run}/train}}.
+
+Usage:
+    python manifest.py list manifest.json
+    python manifest.py materialize manifest.json split output_dir [--link-mode MODE]
+    python manifest.py run manifest.json [--link-mode MODE] -- command ...
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from os.path import join as p_join
+
+from materialize import add_link_mode_argument, materialize
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+SPLIT_PLACEHOLDER = re.compile(r'\{([^{}]+)\}')
+
+
+def write_manifest(file_path, root, splits, seed=None, parameters=None):
+    """
+        Writes the splits ({name: [(image path, label path), ...]}) as a manifest, the paths relative to root.
+        parameters are the settings the splits were made with.
+    """
+    root = os.path.abspath(root)
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'seed': seed,
+        'parameters': parameters or {},
+        'root': root,
+        'splits': {name: [[os.path.relpath(p, root) for p in pair] for pair in pairs]
+                   for name, pairs in splits.items()}
+    }
+    with open(file_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+
+def read_manifest(file_path, root=None):
+    with open(file_path, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f'{file_path}: unsupported manifest version {manifest.get("version")}')
+    if root is not None:
+        manifest['root'] = os.path.abspath(root)
+    return manifest
+
+
+def split_pairs(manifest, split):
+    """
+        Absolute (image path, label path) of all pairs of split.
+    """
+    if split not in manifest['splits']:
+        raise KeyError(f'no split {split} in the manifest, available: {", ".join(manifest["splits"])}')
+    return [tuple(p_join(manifest['root'], p) for p in pair) for pair in manifest['splits'][split]]
+
+
+def materialize_split(pairs, directory, mode='copy'):
+    """
+        Puts the pairs into directory in images/labels format.
+    """
+    for sub_dir in ['images', 'labels']:
+        os.makedirs(p_join(directory, sub_dir), exist_ok=True)
+    for image, label in pairs:
+        materialize(image, p_join(directory, 'images', os.path.basename(image)), mode)
+        materialize(label, p_join(directory, 'labels', os.path.basename(label)), mode)
+
+
+def run_with_splits(manifest, command, mode='symlink'):
+    """
+        Runs command with every {<split>} replaced by a temporary images/labels directory of the split.
+        Placeholders that are no split of the manifest are left as they are. Returns the exit code of the command.
+    """
+    temp_dir = tempfile.mkdtemp(prefix='splits_')
+    directories = {}
+
+    def split_directory(match):
+        split = match.group(1)
+        if split not in manifest['splits']:
+            return match.group(0)
+        if split not in directories:
+            directories[split] = p_join(temp_dir, str(len(directories)))
+            materialize_split(split_pairs(manifest, split), directories[split], mode)
+        return directories[split]
+
+    try:
+        command = [SPLIT_PLACEHOLDER.sub(split_directory, arg) for arg in command]
+        return subprocess.run(command).returncode
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reads the image/label pairs of dataset splits from a manifest')
+    parser.add_argument('--root', default=None, help='dataset directory, if it is not the root of the manifest')
+    commands = parser.add_subparsers(dest='mode', required=True)
+    list_parser = commands.add_parser('list', help='print the splits and their number of pairs')
+    list_parser.add_argument('manifest')
+    materialize_parser = commands.add_parser('materialize', help='put one split into a directory')
+    materialize_parser.add_argument('manifest')
+    materialize_parser.add_argument('split', help='name of the split, e.g. train_experiment/5/0/train')
+    materialize_parser.add_argument('output_dir', help='directory of the split in images/labels format')
+    add_link_mode_argument(materialize_parser, default='symlink')
+    run_parser = commands.add_parser('run', help='run a command with {<split>} replaced by directories of the splits')
+    run_parser.add_argument('manifest')
+    add_link_mode_argument(run_parser, default='symlink')
+    run_parser.add_argument('command', nargs=argparse.REMAINDER, help='command, after --')
+    args = parser.parse_args()
+
+    manifest = read_manifest(args.manifest, args.root)
+    if args.mode == 'list':
+        print(f'seed: {manifest["seed"]}, parameters: {manifest.get("parameters", {})}')
+        for name, pairs in manifest['splits'].items():
+            print(f'{name}\t{len(pairs)}')
+    elif args.mode == 'materialize':
+        materialize_split(split_pairs(manifest, args.split), args.output_dir, args.link_mode)
+    else:
+        command = args.command[1:] if args.command[:1] == ['--'] else args.command
+        if not command:
+            parser.error('no command given')
+        raise SystemExit(run_with_splits(manifest, command, args.link_mode))
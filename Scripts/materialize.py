@@ -0,0 +1,81 @@
+"""
+Materializes files of dataset splits (split_and_sort.py, train_test_split.py, manifest.py) by copying or linking them.
+
+Link modes:
+    copy      copy the file (the default, same as before)
+    hardlink  hard link to the source; the split takes no extra space, but the files share their content, so editing
+              a file of a split also edits the source
+    symlink   symbolic link to the absolute, resolved path of the source
+    reflink   copy-on-write clone of the source (Linux FICLONE, e.g. on btrfs or XFS); no extra space until a file
+              is modified
+
+If a link cannot be created (another file system, no support for the mode, missing privileges on Windows), the file
+is copied instead and a message is printed once per mode.
+"""
+import errno
+import os
+import shutil
+import sys
+import threading
+
+LINK_MODES = ['copy', 'hardlink', 'symlink', 'reflink']
+# ioctl request to clone a file on Linux (_IOW(0x94, 9, int))
+FICLONE = 0x40049409
+
+_fallbacks = set()
+# the splitters materialize files from several threads
+_fallbacks_lock = threading.Lock()
+
+
+def add_link_mode_argument(parser, default='copy'):
+    parser.add_argument('--link-mode', choices=LINK_MODES, default=default,
+                        help='how files are put into the split: ' + ', '.join(LINK_MODES) +
+                             f' (default: {default}); links fall back to copying where they are not possible')
+
+
+def reflink(src, dst):
+    if not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, 'reflinks are only supported on Linux', dst)
+    import fcntl
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+
+
+def link(src, dst, mode):
+    if mode == 'hardlink':
+        os.link(src, dst)
+    elif mode == 'symlink':
+        os.symlink(os.path.realpath(src), dst)
+    elif mode == 'reflink':
+        reflink(src, dst)
+    else:
+        raise ValueError(f'unknown link mode {mode}')
+
+
+def materialize(src, dst, mode='copy'):
+    """
+        Puts the file src at dst according to mode. An existing file at dst is replaced.
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if mode == 'copy' or mode in _fallbacks:
+        shutil.copyfile(src, dst)
+        return
+    try:
+        link(src, dst, mode)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EACCES,
+                           errno.EMLINK, getattr(errno, 'ENOTSUP', errno.EOPNOTSUPP)):
+            raise
+        # another file system or no support for mode, fall back to copying for the rest of the split
+        with _fallbacks_lock:
+            first_fallback = mode not in _fallbacks
+            _fallbacks.add(mode)
+        if first_fallback:
+            print(f'{mode} not possible for {dst} ({e.strerror}), copying instead')
+        shutil.copyfile(src, dst)
@@ -0,0 +1,164 @@
+"""
+Runs the cells of an experiment matrix (see benchmark_matrix.py) resumably.
+
+The state of every cell (pending, running, done or failed) is kept in a SQLite database, so an interrupted campaign
+continues where it stopped when it is started again: done cells are skipped, cells that were running when the
+scheduler died are run again. Up to --concurrency cells run at once. A failed cell is retried up to --retries times,
+waiting --backoff * 2^(attempt - 1) seconds before each retry; it stays failed after that (--retry-failed runs it
+again in a later invocation).
+
+Usage:
+    python schedule_matrix.py run evias_matrix.json state_dir [--concurrency N] [--retries N] [--backoff S]
+    python schedule_matrix.py status state_dir
+"""
+import argparse
+import os
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from os.path import join as p_join
+
+from benchmark_matrix import cell_command, expand_matrix, load_matrix, run_measured
+
+STATE_DB = 'state.db'
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+
+def open_state(state_dir):
+    os.makedirs(state_dir, exist_ok=True)
+    connection = sqlite3.connect(p_join(state_dir, STATE_DB))
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS cells (
+            name TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            results_dir TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL DEFAULT 0,
+            returncode INTEGER,
+            wall_s REAL,
+            cpu_s REAL,
+            peak_rss_mb REAL,
+            updated REAL
+        )""")
+    connection.commit()
+    return connection
+
+
+def register_cells(connection, cells, retry_failed=False):
+    """
+        Adds new cells as pending and resets cells left running by an interrupted scheduler.
+    """
+    connection.executemany('INSERT OR IGNORE INTO cells (name, status, results_dir, updated) VALUES (?, ?, ?, ?)',
+                           [(c['name'], PENDING, c['results_dir'], time.time()) for c in cells])
+    # an interrupted attempt does not count as a failed one
+    connection.execute('UPDATE cells SET status = ?, attempts = attempts - 1 WHERE status = ?', (PENDING, RUNNING))
+    if retry_failed:
+        connection.execute('UPDATE cells SET status = ?, attempts = 0, next_attempt = 0 WHERE status = ?',
+                           (PENDING, FAILED))
+    connection.commit()
+
+
+def set_state(connection, name, status, **values):
+    columns = ['status', 'updated'] + list(values)
+    connection.execute(f'UPDATE cells SET {", ".join(c + " = ?" for c in columns)} WHERE name = ?',
+                       [status, time.time()] + list(values.values()) + [name])
+    connection.commit()
+
+
+def run_cell(matrix, cell, log_dir, attempt):
+    return run_measured(cell_command(matrix, cell), p_join(log_dir, f'{cell["name"]}.{attempt}.log'))
+
+
+def run_schedule(matrix, state_dir, concurrency=1, retries=2, backoff=60.0, retry_failed=False):
+    """
+        Runs all cells of matrix that are not done yet. Returns the number of failed cells.
+    """
+    cells = {c['name']: c for c in expand_matrix(matrix)}
+    log_dir = p_join(state_dir, 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+    connection = open_state(state_dir)
+    register_cells(connection, cells.values(), retry_failed)
+
+    running = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            now = time.time()
+            ready = connection.execute(
+                'SELECT name, attempts FROM cells WHERE status = ? AND next_attempt <= ? ORDER BY rowid',
+                (PENDING, now)).fetchall()
+            for name, attempts in ready:
+                if len(running) >= concurrency:
+                    break
+                if name not in cells:
+                    continue
+                set_state(connection, name, RUNNING, attempts=attempts + 1)
+                print(f'start {name} (attempt {attempts + 1})', flush=True)
+                running[executor.submit(run_cell, matrix, cells[name], log_dir, attempts + 1)] = (name, attempts + 1)
+
+            waiting = connection.execute('SELECT MIN(next_attempt) FROM cells WHERE status = ? AND name IN (%s)'
+                                         % ','.join('?' * len(cells)), [PENDING] + list(cells)).fetchone()[0]
+            if not running:
+                if waiting is None:
+                    break
+                time.sleep(max(waiting - time.time(), 0))
+                continue
+
+            # with free slots, wake up for the next cell whose backoff ends
+            timeout = None if waiting is None or len(running) >= concurrency else max(waiting - time.time(), 0)
+            finished, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, attempt = running.pop(future)
+                try:
+                    returncode, wall, cpu, peak_rss_mb = future.result()
+                except OSError as e:
+                    print(f'{name}: {e}', flush=True)
+                    returncode, wall, cpu, peak_rss_mb = None, None, None, None
+                values = dict(returncode=returncode, wall_s=wall, cpu_s=cpu, peak_rss_mb=peak_rss_mb)
+                if returncode == 0:
+                    set_state(connection, name, DONE, **values)
+                    print(f'done {name}', flush=True)
+                elif attempt <= retries:
+                    delay = backoff * 2 ** (attempt - 1)
+                    set_state(connection, name, PENDING, next_attempt=time.time() + delay, **values)
+                    print(f'failed {name} (exit {returncode}), retrying in {delay:.0f} s', flush=True)
+                else:
+                    set_state(connection, name, FAILED, **values)
+                    print(f'failed {name} (exit {returncode}), giving up', flush=True)
+
+    failed = connection.execute('SELECT COUNT(*) FROM cells WHERE status = ? AND name IN (%s)'
+                                % ','.join('?' * len(cells)), [FAILED] + list(cells)).fetchone()[0]
+    connection.close()
+    return failed
+
+
+def print_status(state_dir):
+    connection = open_state(state_dir)
+    for status, count in connection.execute('SELECT status, COUNT(*) FROM cells GROUP BY status ORDER BY status'):
+        print(f'{status}: {count}')
+    for row in connection.execute('SELECT name, status, attempts, returncode, wall_s, results_dir FROM cells '
+                                  'ORDER BY rowid'):
+        print('\t'.join('' if v is None else str(v) for v in row))
+    connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs the cells of an experiment matrix resumably')
+    commands = parser.add_subparsers(dest='mode', required=True)
+    run_parser = commands.add_parser('run', help='run all cells that are not done yet')
+    run_parser.add_argument('matrix', help='matrix JSON file, see evias_matrix.json')
+    run_parser.add_argument('state_dir', help=f'directory of the state database ({STATE_DB}) and the logs')
+    run_parser.add_argument('--concurrency', type=int, default=0,
+                            help='number of cells run at once, 0 uses all cores (default: 0)')
+    run_parser.add_argument('--retries', type=int, default=2, help='retries of a failed cell (default: 2)')
+    run_parser.add_argument('--backoff', type=float, default=60.0,
+                            help='seconds before the first retry, doubled for every further retry (default: 60)')
+    run_parser.add_argument('--retry-failed', action='store_true',
+                            help='run the cells that failed in an earlier invocation again')
+    status_parser = commands.add_parser('status', help='print the state of all cells')
+    status_parser.add_argument('state_dir')
+    args = parser.parse_args()
+    if args.mode == 'run':
+        failed = run_schedule(load_matrix(args.matrix), args.state_dir, args.concurrency or os.cpu_count(),
+                              args.retries, args.backoff, args.retry_failed)
+        raise SystemExit(1 if failed else 0)
+    print_status(args.state_dir)
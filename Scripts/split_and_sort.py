@@ -1,18 +1,28 @@
+import argparse
 import os
-import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from contextlib import suppress
-from shutil import copyfile
+from materialize import add_link_mode_argument, materialize
 
 """
 This script splits datasets in regionmarker-format into different datasets in regionmarger-format based on the classes.
 Each class gets its own dataset. This way we can easily build individual pipelines for each class
 """
 
-input_directory = Path(sys.argv[1])
+parser = argparse.ArgumentParser(description='Splits a dataset in regionmarker-format into one dataset per class')
+parser.add_argument('input_directory', help='dataset with images and regions directories')
+parser.add_argument('output_directory', nargs='?',
+                    help='directory of the class datasets (default: <input_directory>_split_and_sorted)')
+add_link_mode_argument(parser)
+parser.add_argument('--workers', type=int, default=0,
+                    help='number of threads listing and copying the files, 0 uses 4 per core (at most 32)')
+args = parser.parse_args()
 
-if len(sys.argv) > 2:
-    output_directory = sys.argv[2]
+input_directory = Path(args.input_directory)
+
+if args.output_directory is not None:
+    output_directory = args.output_directory
 else:
     output_directory = os.path.join(input_directory.parent, input_directory.name + "_split_and_sorted")
     
@@ -29,38 +39,77 @@ if not all([x in os.listdir(input_directory) for x in ["images", "regions"]]):
 regions_path = os.path.join(input_directory, "regions")
 images_path = os.path.join(input_directory, "images")
 
-def get_image_path(region_dir_name):
-    return [Path(os.path.join(images_path, x)) for x in os.listdir(images_path) if region_dir_name == Path(x).stem][0]
+def index_images(images_path):
+    """
+    Maps the stem of every image to its path, with one listing of images_path.
+    Stems that belong to several images are collected separately.
+    """
+    index = {}
+    duplicates = {}
+    for x in os.listdir(images_path):
+        stem = Path(x).stem
+        if stem in index or stem in duplicates:
+            duplicates.setdefault(stem, [index.pop(stem)] if stem in index else []).append(Path(images_path, x))
+        else:
+            index[stem] = Path(images_path, x)
+    return index, duplicates
 
-for region_dir_name in os.listdir(regions_path):
 
-#try:
-    region_dir = os.path.join(regions_path, region_dir_name)
-    classes = set([z.split('_')[0] for z in os.listdir(region_dir)])
-    
-    for c in classes:
-        class_regions_path = os.path.join(output_directory, c, "regions", region_dir_name)
-        class_images_path = os.path.join(output_directory, c, "images")
-        create_dir(class_regions_path)
-        create_dir(class_images_path)
-        image_path = get_image_path(region_dir_name)
-        # image only gets copied if it contains one of the classes
-        copyfile(image_path, os.path.join(class_images_path, image_path.name))
-        
-        for z in [x for x in os.listdir(region_dir) if c in x]:
-            z_path = Path(os.path.join(region_dir, z))
-            copyfile(z_path, os.path.join(class_regions_path, z_path.name))
+image_index, duplicate_images = index_images(images_path)
 
-        assert len(os.listdir(os.path.join(output_directory, c, "regions"))) == len(os.listdir(class_images_path))
-#except Exception as e:
-#    print(e)
-        
 
-        
-        
-        
-        
+def get_image_path(region_dir_name):
+    if region_dir_name in duplicate_images:
+        raise ValueError("Several images for region directory {}: {}".format(
+            region_dir_name, ", ".join(p.name for p in duplicate_images[region_dir_name])))
+    if region_dir_name not in image_index:
+        raise FileNotFoundError("No image for region directory {} in {}".format(region_dir_name, images_path))
+    return image_index[region_dir_name]
+
+def region_classes(region_dir_name):
+    """
+    The region files of a region directory grouped by their class (the part of the name before the first '_').
+    """
+    region_dir = os.path.join(regions_path, region_dir_name)
+    classes = {}
+    for z in os.listdir(region_dir):
+        classes.setdefault(z.split('_')[0], []).append(Path(region_dir, z))
+    return classes
+
 
+def copy_class(region_dir_name, c, region_files):
+    """
+    Puts the image of a region directory and its region files of class c into the dataset of c.
+    """
+    image_path = get_image_path(region_dir_name)
+    class_regions_path = os.path.join(output_directory, c, "regions", region_dir_name)
+    class_images_path = os.path.join(output_directory, c, "images")
+    create_dir(class_regions_path)
+    create_dir(class_images_path)
+    # image only gets copied if it contains one of the classes
+    materialize(image_path, os.path.join(class_images_path, image_path.name), args.link_mode)
+    for z_path in region_files:
+        materialize(z_path, os.path.join(class_regions_path, z_path.name), args.link_mode)
+    return image_path.name
 
 
+# copying is bound by I/O (network storage), so there are many more threads than cores
+workers = args.workers or min(32, 4 * (os.cpu_count() or 1))
+region_dir_names = os.listdir(regions_path)
+expected = {}
+with ThreadPoolExecutor(max_workers=workers) as executor:
+    copies = {}
+    for region_dir_name, classes in zip(region_dir_names, executor.map(region_classes, region_dir_names)):
+        for c, region_files in classes.items():
+            copies[executor.submit(copy_class, region_dir_name, c, region_files)] = (c, region_dir_name)
+    for future in as_completed(copies):
+        c, region_dir_name = copies[future]
+        expected.setdefault(c, {})[region_dir_name] = future.result()
 
+# every class dataset has exactly one image per region directory
+for c, images in expected.items():
+    regions = os.listdir(os.path.join(output_directory, c, "regions"))
+    class_images = os.listdir(os.path.join(output_directory, c, "images"))
+    assert sorted(regions) == sorted(images) and sorted(class_images) == sorted(images.values()), \
+        f"class {c}: {len(regions)} region directories, {len(class_images)} images"
+print(f"{len(region_dir_names)} images sorted into {len(expected)} classes")
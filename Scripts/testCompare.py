@@ -6,8 +6,15 @@ from scipy import stats
 import matplotlib
 matplotlib.use('Agg') # this is required on the server, because no actual "plots" can be created and rendered
 import matplotlib.pyplot as plt
+import argparse
+import json
 import os
 import sys
+import warnings
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir,"IO"))
+import summary_store
 """
 Created on Wed Mar 11 13:53:53 2020
 
@@ -15,249 +22,481 @@ Created on Wed Mar 11 13:53:53 2020
 """
 
 """
-Usage should be: python testCompare.py parentDir commitHashA commitHashB
+Usage should be: python testCompare.py parentDir resultsDir commitHashA commitHashB [commitHashC ...] [--gate]
+Compares any number of versions (commits) in one pass. The number of runs and generations is taken from the files.
+
+With --gate, every version is tested against the first one (the baseline) on the best fitness values of overview.txt:
+per image with a one-sided Mann-Whitney U test over the runs, overall with a one-sided Wilcoxon signed-rank test
+over the mean best fitness per image (paired by image). Both come with a bootstrap confidence interval of the mean
+difference. A version regresses if its best fitness is significantly lower (p < alpha) and the mean drop is larger
+than the threshold. The one-sided Wilcoxon test cannot get below p = 1/2^n for n images, so with too few images
+(fewer than 5 at alpha = 0.05) the overall verdict is taken from the bootstrap interval instead: a version regresses
+if the upper bound of the interval of the mean difference is below -threshold.
+The results are written as JSON and JUnit XML and the script exits with 1 on any regression.
 """
-print(len(sys.argv))
-for i in range(len(sys.argv)):
-    print(sys.argv[i])
-if(len(sys.argv)==5):
-    #print("parametros:")
-    #print(str(sys.argv))
-    
-    resultsPath0=sys.argv[2]
-    
-    dirResults=os.path.join(resultsPath0,"CompareResults")
-    if not os.path.exists(dirResults):
-        os.makedirs(dirResults)
-    else: 
-        #FileExistsError("Results directory already exists")
-        print("Results directory already exists")
-    
-    dirBilderPath=os.path.join(dirResults,"Bilder")
-    if not os.path.exists(dirBilderPath):
-        os.makedirs(dirBilderPath)
+
+BOOTSTRAP_SAMPLES=10000
+GATE_ALPHA=0.05
+GATE_THRESHOLD=0.01
+CONVERGENCE_THRESHOLDS=[0.5,0.8,0.9,0.95]
+CONTACT_SHEET_SCALE=2 # jedes n-te Pixel der Einzelbilder kommt in den Kontaktabzug
+
+
+def findRuns(imagePath, summary=None):
+    """
+    Run numbers of an image that have a BestIndividualFit curve, from its summary (see loadFitness) if there is one,
+    else from the Analyzer/<k> directories. The directories of all runs are created before the batch starts, a run
+    that failed leaves an empty one.
+    """
+    if summary is not None:
+        return np.unique(summary["run"][~np.isnan(summary["best_fitness"])]).tolist()
+    analyzerPath=os.path.join(imagePath,"Analyzer")
+    if not os.path.isdir(analyzerPath):
+        return []
+    return sorted(int(d) for d in os.listdir(analyzerPath)
+                  if d.isdigit() and os.path.exists(os.path.join(analyzerPath,d,"BestIndividualFit.txt")))
+
+
+def loadBestIndividualFit(imagePath, runs, summary=None):
+    """
+    BestIndividualFit values of the given runs of an image as list of arrays, one per run.
+    Uses the summary if there is one, else reads the value column of every Analyzer/<k>/BestIndividualFit.txt in one go.
+    """
+    if summary is not None:
+        return [summary_store.run_curve(summary,k,"best_fitness")[1] for k in runs]
+    curves=[]
+    for k in runs:
+        analyzerPath=os.path.join(imagePath,"Analyzer",str(k),"BestIndividualFit.txt")
+        curves.append(np.loadtxt(analyzerPath,delimiter=",",skiprows=1,usecols=1,ndmin=1))
+    return curves
+
+
+def loadOverviewBestFitness(imagePath):
+    """
+    Best fitness of all runs of an image, from the lines "Iteration: <i> Best Fitness: <value>" of overview.txt.
+    The iteration counts the runs in the order they finished, it is not the number of the Analyzer/<k> run.
+    """
+    overviewPath=os.path.join(imagePath,"overview.txt")
+    return np.loadtxt(overviewPath,usecols=4,ndmin=1)
+
+
+def findImages(pathVersions):
+    """
+    Returns the images with an overview.txt in every version (in the order of the first version) and the images
+    that are missing in some version.
+    """
+    complete=None
+    allImages=[]
+    for versionPath in pathVersions:
+        images=sorted(os.listdir(versionPath))
+        allImages+= [b for b in images if b not in allImages]
+        withOverview=set(b for b in images if os.path.exists(os.path.join(versionPath,b,"overview.txt")))
+        complete=withOverview if complete is None else complete & withOverview
+    images=[b for b in allImages if b in complete]
+    missing=[b for b in allImages if b not in complete]
+    return images, missing
+
+
+def loadFitness(pathVersions, images):
+    """
+    Returns the BestIndividualFit curves as (versions x images x runs x generations) array and the best fitness
+    values of the overviews as (versions x images x runs) array. The number of runs and generations is the maximum
+    over all images of all versions; shorter curves and missing runs are NaN. Runs without a curve (failed runs) are
+    left out; the best fitness values are all values of overview.txt, they are not matched to the curves.
+    The curves are read from summary.npz (written by IO/summary_store.py) if it is newer than the Analyzer files and
+    overview.json of the image, else from the Analyzer directories.
+    """
+    curves={}
+    bestFitness={}
+    for i in range(len(pathVersions)):
+        for j in range(len(images)):
+            imagePath=os.path.join(pathVersions[i],images[j])
+            summary=summary_store.load_current_summary(imagePath)
+            runs=findRuns(imagePath,summary)
+            curves[i,j]=loadBestIndividualFit(imagePath,runs,summary)
+            bestFitness[i,j]=loadOverviewBestFitness(imagePath)
+    runCount=max([len(c) for c in curves.values()]+[0])
+    generationCount=max([len(curve) for c in curves.values() for curve in c]+[0])
+    fitness=np.full((len(pathVersions),len(images),runCount,generationCount),np.nan)
+    best=np.full((len(pathVersions),len(images),max([len(b) for b in bestFitness.values()]+[0])),np.nan)
+    for (i,j),c in curves.items():
+        for k,curve in enumerate(c):
+            fitness[i,j,k,:len(curve)]=curve
+        best[i,j,:len(bestFitness[i,j])]=bestFitness[i,j]
+    return fitness, best
+
+
+def runningMeanDifference(fitness):
+    """
+    Difference to the optimal fitness 1.0, averaged over the generations up to each generation of a run.
+    NaN where the curve has no value.
+    """
+    valid=~np.isnan(fitness)
+    difSum=np.cumsum(np.where(valid,1.0-fitness,0.0),axis=-1)
+    count=np.cumsum(valid,axis=-1)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        return np.where(valid,difSum/count,np.nan)
+
+
+def anytimeFitness(fitness):
+    """
+    Best fitness found up to each generation of a run (the curves are usually monotone already).
+    NaN where the curve has no value.
+    """
+    return np.where(np.isnan(fitness),np.nan,np.fmax.accumulate(fitness,axis=-1))
+
+
+def convergenceMetrics(fitness, thresholds=CONVERGENCE_THRESHOLDS):
+    """
+    Convergence speed of the (versions x images x runs x generations) curves:
+    generations until each threshold is reached per run (NaN if never), the area under the curve per run normalized
+    to the number of generations (mean fitness over the generations) and the anytime profile per version, i.e. the
+    mean best fitness so far over all images and runs at each generation.
+    """
+    anytime=anytimeFitness(fitness)
+    generationsTo={}
+    for threshold in thresholds:
+        reached=anytime>=threshold
+        generationsTo[threshold]=np.where(np.any(reached,axis=-1),np.argmax(reached,axis=-1),np.nan)
+    with warnings.catch_warnings():
+        # missing runs are all NaN
+        warnings.simplefilter('ignore',RuntimeWarning)
+        auc=np.nanmean(fitness,axis=-1)
+        profile=np.nanmean(anytime,axis=(1,2))
+    return generationsTo, auc, profile
+
+
+def plotImageFitnessCurves(imageFitness, versions, image, path):
+    """
+    One plot per version with the BestIndividualFit curves of all runs of one image, imageFitness being a
+    (versions x runs x generations) array. The figure is closed after saving, so only one is held at a time.
+    """
+    fig = plt.figure(figsize=(5,len(versions)*3.5))
+    fig.subplots_adjust(hspace=0.4,wspace=0.4)
+    generationen=np.arange(imageFitness.shape[-1])
+    for i in range(len(versions)):
+        axs=fig.add_subplot(len(versions),1,i+1)
+        for k in range(imageFitness.shape[1]):
+            if not np.all(np.isnan(imageFitness[i,k])):
+                axs.plot(generationen,imageFitness[i,k],label='Iteration: ' + str(k))
+        axs.set_title("Version: "+ str(versions[i])+" Image: " + str(image))
+        axs.set_xlabel("Generationen")
+        axs.set_ylabel("Fitness")
+        axs.legend()
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+
+def plotFitnessCurves(fitness, versions, images, dirPath, workers=1):
+    """
+    Saves one figure per image (Bild_<image>.png) into dirPath, rendered in a pool of workers processes.
+    Returns the paths of the figures in the order of images.
+    """
+    paths=[os.path.join(dirPath,"Bild_"+str(image)+".png") for image in images]
+    if workers<=1:
+        return [plotImageFitnessCurves(fitness[:,j],versions,images[j],paths[j]) for j in range(len(images))]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures=[executor.submit(plotImageFitnessCurves,fitness[:,j],versions,images[j],paths[j])
+                 for j in range(len(images))]
+        return [future.result() for future in futures]
+
+
+def createContactSheet(paths, path, scale=CONTACT_SHEET_SCALE):
+    """
+    Tiles the figures in paths (all of the same size) into one image, reduced by scale. The figures are read one at
+    a time.
+    """
+    if not paths:
+        return
+    columns=int(np.ceil(np.sqrt(len(paths))))
+    rows=int(np.ceil(len(paths)/columns))
+    sheet=None
+    for n,figurePath in enumerate(paths):
+        figure=plt.imread(figurePath)[::scale,::scale]
+        height,width=figure.shape[:2]
+        if sheet is None:
+            sheet=np.ones((rows*height,columns*width,figure.shape[2]),dtype=figure.dtype)
+        row,column=divmod(n,columns)
+        sheet[row*height:(row+1)*height,column*width:(column+1)*width]=figure[:height,:width]
+    plt.imsave(path,sheet)
+
+
+def plotBestFitnessHistograms(bestFitness, listMean, listStd, versions, images, path):
+    """
+    Normal distribution and histogram (per image) of the best fitness values of each version.
+    """
+    f=plt.figure(figsize=(10,len(versions)*8))
+    f.subplots_adjust(hspace=0.4,wspace=0.4)
+    for i in range(len(versions)):
+        normal=stats.norm(loc=listMean[i],scale=listStd[i])
+        x=np.linspace(normal.ppf(0.001),normal.ppf(0.999),100)
+        axs=f.add_subplot(len(versions),1,(i+1))
+        axs.plot(x,normal.pdf(x))
+        for h in range(len(images)):
+            fit=bestFitness[i,h]
+            axs.hist(fit[~np.isnan(fit)],label=images[h])
+        axs.set_title( "Normal distribution and Histogram of best fitness values (Version: "+str(versions[i]) +")" )
+        axs.set_xlabel("Fitness")
+        axs.set_ylabel("Frequency")
+        axs.legend()
+    f.savefig(path)
+    plt.close(f)
+
+
+def bootstrapInterval(means, confidence=0.95):
+    """
+    Percentile interval of the bootstrapped means.
+    """
+    low,high=np.percentile(means,[50*(1-confidence),50*(1+confidence)])
+    return float(low), float(high)
+
+
+def compareImage(baseline, candidate, rng, samples=BOOTSTRAP_SAMPLES):
+    """
+    One-sided Mann-Whitney U test (candidate lower than baseline) and bootstrap interval of the difference of the
+    means of the best fitness values of the runs of one image.
+    """
+    statistic,pValue=stats.mannwhitneyu(candidate,baseline,alternative='less')
+    resampled=(candidate[rng.integers(0,len(candidate),(samples,len(candidate)))].mean(axis=1)-
+               baseline[rng.integers(0,len(baseline),(samples,len(baseline)))].mean(axis=1))
+    ciLow,ciHigh=bootstrapInterval(resampled)
+    return 'mannwhitneyu', float(statistic), float(pValue), ciLow, ciHigh
+
+
+def compareOverall(differences, rng, samples=BOOTSTRAP_SAMPLES):
+    """
+    One-sided Wilcoxon signed-rank test and bootstrap interval of the mean of the per image differences of the mean
+    best fitness (candidate - baseline).
+    """
+    if np.any(differences!=0):
+        statistic,pValue=stats.wilcoxon(differences,alternative='less')
     else:
-        #FileExistsError("Bilder directory already exists")
-        print("Bild directory already exists")
-    version1=sys.argv[3]
-    version2=sys.argv[4]
-    listVersions=[]
-    listActualVersions=[]
-    #datenPath=os.path.abspath(os.path.join("Daten")) # WICHTIG: Das Verzeichnis Daten sollte in der selbe Verzeichnis wie der Skript testCompare.py liegen.
-    datenPath=sys.argv[1] 
-    resultBilderPath=os.path.join(dirResults,"Bilder")
-    
-    
-    listVersions=os.listdir(datenPath) 
-    pathVersions=[]
-    listMean=[]
-    listStd=[]
-
-    for i in range(len(listVersions)):
-        if(listVersions[i] == version1 or listVersions[i]==version2):
-            pathVersions.insert(i,os.path.join(datenPath, listVersions[i])) 
-            listActualVersions.insert(i,listVersions[i])
-    resultsPath=os.path.join(dirResults,"compareResults_verion_"+str(version1)+"_mit_"+str(version2)+".txt")
-    #resultsPath=os.path.abspath(os.path.join("CompareResults","compareResults_version_"+str(version1)+"_mit_"+str(version2)+".txt"))
-    
-    lBilder=[] #listBilder
-    lBilder2=[]
-    lBilder3=[]
-    lBilder4=[] #hier sind die Bilder die vollständig sind
-    lNBilder=[]
-    lPathBilder=[]
-    lPathBilder2=[]
-    lPathBilderOverview=[]
-    overviewP=[]
-    overviewP2=[]
-    for w in range(len(listActualVersions)):
-        lBilder.insert(w,os.listdir(pathVersions[w]))
-    
-    for b in range(len(lBilder)-1):
-        for f in range(len(lBilder[0])):
-            if(lBilder[b][f]==lBilder[b+1][f]):
-                lBilder2.append(lBilder[b][f])
-    
-    
-    for h in range(len(listActualVersions)):
-        
-        for z in range(len(lBilder2)):
-            lPathBilder.insert(z,os.path.join(pathVersions[h],lBilder2[z]))
-            oP=os.path.abspath(os.path.join(lPathBilder[z],"overview.txt"))
-            if(os.path.exists(oP)==True):
-                lBilder3.append(lBilder2[z])
-                #lPathBilder2.append(oP)
-    for l in range(len(lBilder2)):
-        if(lBilder3.count(lBilder2[l])==len(listActualVersions)):
-            lBilder4.append(lBilder2[l])
+        statistic,pValue=0.0,1.0
+    resampled=differences[rng.integers(0,len(differences),(samples,len(differences)))].mean(axis=1)
+    ciLow,ciHigh=bootstrapInterval(resampled)
+    return 'wilcoxon', float(statistic), float(pValue), ciLow, ciHigh
+
+
+def regressionGate(bestFitness, versions, images, alpha=GATE_ALPHA, threshold=GATE_THRESHOLD,
+                   samples=BOOTSTRAP_SAMPLES, seed=0):
+    """
+    Compares the best fitness values (versions x images x runs) of every version with the first version.
+    Returns one result per version and image and one overall result per version (image None). With too few images
+    for the Wilcoxon test to reach alpha, the overall verdict is taken from the bootstrap interval (test 'bootstrap').
+    """
+    rng=np.random.default_rng(seed)
+    results=[]
+    for i in range(1,len(versions)):
+        differences=[]
+        for j in range(len(images)):
+            baseline=bestFitness[0,j][~np.isnan(bestFitness[0,j])]
+            candidate=bestFitness[i,j][~np.isnan(bestFitness[i,j])]
+            if len(baseline)==0 or len(candidate)==0:
+                continue
+            difference=float(np.mean(candidate)-np.mean(baseline))
+            differences.append(difference)
+            test,statistic,pValue,ciLow,ciHigh=compareImage(baseline,candidate,rng,samples)
+            results.append({'version':versions[i],'image':images[j],'test':test,'statistic':statistic,
+                            'p_value':pValue,'baseline_mean':float(np.mean(baseline)),
+                            'mean':float(np.mean(candidate)),'difference':difference,
+                            'ci_low':ciLow,'ci_high':ciHigh,
+                            'regression':bool(pValue<alpha and difference<-threshold)})
+        if not differences:
+            continue
+        differences=np.array(differences)
+        test,statistic,pValue,ciLow,ciHigh=compareOverall(differences,rng,samples)
+        difference=float(np.mean(differences))
+        if(0.5**len(differences)<alpha):
+            regression=pValue<alpha and difference<-threshold
         else:
-            lNBilder.append(lBilder2[l])
-            
+            #der einseitige Wilcoxon-Test kommt mit n Bildern nicht unter p=1/2^n: Urteil aus dem Bootstrap-Intervall
+            test='bootstrap'
+            regression=ciHigh<-threshold
+        results.append({'version':versions[i],'image':None,'test':test,'statistic':statistic,'p_value':pValue,
+                        'baseline_mean':float(np.nanmean(bestFitness[0])),'mean':float(np.nanmean(bestFitness[i])),
+                        'difference':difference,'ci_low':ciLow,'ci_high':ciHigh,
+                        'regression':bool(regression)})
+    return results
+
+
+def summarizeConvergence(generationsTo, auc, profile, versions, images):
+    """
+    Per version and per image: median generations to each threshold, fraction of runs reaching it, mean and std of
+    the area under the curve. Per version also the anytime profile.
+    """
+    def summarize(i, j=slice(None)):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore',RuntimeWarning)
+            runAuc=auc[i,j][~np.isnan(auc[i,j])]
+            summary={'generations_to_threshold':{},'reached':{},
+                     'auc_mean':float(np.mean(runAuc)) if len(runAuc) else None,
+                     'auc_std':float(np.std(runAuc)) if len(runAuc) else None}
+            for threshold,generations in generationsTo.items():
+                median=np.nanmedian(generations[i,j])
+                summary['generations_to_threshold'][str(threshold)]=None if np.isnan(median) else float(median)
+                summary['reached'][str(threshold)]=float(np.sum(~np.isnan(generations[i,j]))/max(len(runAuc),1))
+        return summary
+
+    return [dict(version=versions[i],**summarize(i),
+                 images={images[j]:summarize(i,j) for j in range(len(images))},
+                 anytime_profile=[None if np.isnan(v) else float(v) for v in profile[i]])
+            for i in range(len(versions))]
+
+
+def plotAnytimeProfile(profile, versions, path):
+    fig=plt.figure(figsize=(10,5))
+    axs=fig.add_subplot(1,1,1)
+    for i in range(len(versions)):
+        axs.plot(np.arange(profile.shape[1]),profile[i],label="Version: "+str(versions[i]))
+    axs.set_title("Anytime performance (mean best fitness so far)")
+    axs.set_xlabel("Generationen")
+    axs.set_ylabel("Fitness")
+    axs.legend()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def describeResult(result):
+    return (("overall" if result['image'] is None else result['image']) + ": difference " +
+            "{:.4f} [{:.4f}, {:.4f}], {} p={:.4g}".format(result['difference'],result['ci_low'],result['ci_high'],
+                                                       result['test'],result['p_value']))
+
+
+def writeGateJson(results, baseline, alpha, threshold, path):
+    with open(path,'w') as f:
+        json.dump({'baseline':baseline,'alpha':alpha,'threshold':threshold,'results':results},f,indent=2)
+
+
+def writeGateJUnit(results, versions, path):
+    """
+    JUnit XML with one testsuite per compared version and one testcase per image (and overall), failing on regression.
+    """
+    failures=sum(r['regression'] for r in results)
+    root=ET.Element('testsuites',name='testCompare',tests=str(len(results)),failures=str(failures))
+    for version in versions[1:]:
+        versionResults=[r for r in results if r['version']==version]
+        suite=ET.SubElement(root,'testsuite',name='testCompare.'+version,tests=str(len(versionResults)),
+                            failures=str(sum(r['regression'] for r in versionResults)),errors='0',skipped='0')
+        for r in versionResults:
+            case=ET.SubElement(suite,'testcase',name="overall" if r['image'] is None else r['image'],
+                               classname='testCompare.'+version)
+            if r['regression']:
+                ET.SubElement(case,'failure',message='best fitness regressed against '+versions[0]).text=describeResult(r)
+            ET.SubElement(case,'system-out').text=describeResult(r)
+    ET.ElementTree(root).write(path,encoding='utf-8',xml_declaration=True)
+
+
+if __name__ == '__main__':
+    parser=argparse.ArgumentParser(description='Compares the fitness of test batches of several versions (commits)')
+    parser.add_argument('data_dir',help='directory containing one directory of images per version')
+    parser.add_argument('results_dir',help='CompareResults is written into this directory')
+    parser.add_argument('versions',nargs='+',help='versions to compare, the first one is the baseline of --gate')
+    parser.add_argument('--gate',action='store_true',
+                        help='test every version against the baseline, write regressionGate.json and '
+                             'regressionGate.xml (JUnit) and exit with 1 if a version regressed; with fewer images '
+                             'than the Wilcoxon test needs for --alpha (p >= 1/2^n), the overall verdict comes from '
+                             'the bootstrap interval')
+    parser.add_argument('--alpha',type=float,default=GATE_ALPHA,
+                        help='significance level of the gate (default: {})'.format(GATE_ALPHA))
+    parser.add_argument('--threshold',type=float,default=GATE_THRESHOLD,
+                        help='minimum drop of the mean best fitness that counts as regression '
+                             '(default: {})'.format(GATE_THRESHOLD))
+    parser.add_argument('--bootstrap',type=int,default=BOOTSTRAP_SAMPLES,
+                        help='number of bootstrap samples (default: {})'.format(BOOTSTRAP_SAMPLES))
+    parser.add_argument('--seed',type=int,default=0,help='seed of the bootstrap (default: 0)')
+    parser.add_argument('--workers',type=int,default=0,
+                        help='number of processes rendering the figures, 0 uses all cores (default: 0)')
+    parser.add_argument('--contact-sheet',action='store_true',
+                        help='also tile the figures of all images into Bilder/Kontaktabzug.png')
+    parser.add_argument('--convergence',action='store_true',
+                        help='compute generations to threshold, area under the fitness curve and the anytime profile '
+                             'of every version, written to convergence.json and Bilder/Anytime.png')
+    parser.add_argument('--convergence-thresholds',type=float,nargs='+',default=CONVERGENCE_THRESHOLDS,
+                        help='fitness thresholds of --convergence (default: {})'.format(
+                            ' '.join(str(t) for t in CONVERGENCE_THRESHOLDS)))
+    parser.add_argument('--json',help='path of the JSON results (default: CompareResults/regressionGate.json)')
+    parser.add_argument('--junit',help='path of the JUnit results (default: CompareResults/regressionGate.xml)')
+    args=parser.parse_args()
+    if len(args.versions)<2:
+        parser.error('at least two versions are needed')
+
+    datenPath=args.data_dir
+    dirResults=os.path.join(args.results_dir,"CompareResults")
+    resultBilderPath=os.path.join(dirResults,"Bilder")
+    os.makedirs(resultBilderPath,exist_ok=True)
+
+    listVersions=os.listdir(datenPath)
+    listActualVersions=[v for v in args.versions if v in listVersions]
+    missingVersions=[v for v in args.versions if v not in listVersions]
+    if missingVersions:
+        print("Es fehlen folgende Versionen: ")
+        print(missingVersions)
+    pathVersions=[os.path.join(datenPath,v) for v in listActualVersions]
+    resultsPath=os.path.join(dirResults,"compareResults_verion_"+"_mit_".join(listActualVersions)+".txt")
+
+    lBilder,lNBilder=findImages(pathVersions)
     print("")
     print("Es fehlt folgende Daten: ")
     print(lNBilder)
-    
-    for t in range(len(listActualVersions)):
-        for g in range(len(lBilder4)):
-            lPathBilder2.insert(g,os.path.join(pathVersions[t],lBilder4[g]))
-            oP2=os.path.abspath(os.path.join(lPathBilder2[g],"overview.txt"))
-            lPathBilderOverview.append(oP2)
-
-    listBestFitnessItVersion=np.zeros((len(listActualVersions),(len(lBilder4)*5)))#es gibt nur Overview für 3 Bilder also 3*5=15 spalten 
-    #listAllFitness=np.zeros((202,(len(lBilder4)*len(listActualVersions)*5)))
-    fig = plt.figure(figsize=(len(lBilder4)*5,len(listActualVersions)*3.5))
-    fig.subplots_adjust(hspace=0.4,wspace=0.4)
+
+    fitness,bestFitness=loadFitness(pathVersions,lBilder)
+    print("Iterationen: " + str(fitness.shape[2]) + ", Generationen: " + str(fitness.shape[3]))
+    difIt=runningMeanDifference(fitness)
+    listMean=np.nanmean(bestFitness,axis=(1,2))
+    listStd=np.nanstd(bestFitness,axis=(1,2))
     with open(resultsPath,'w') as file:
-            
         for i in range(len(listActualVersions)):
-            
             print("")
             print("Actual Version: ")
             print(listActualVersions[i])
             file.write(os.linesep + "Version: " + listActualVersions[i]+os.linesep)
-            listPathBilder=[]
-            bestFitnessValues=[]
-            
-            
-            for s in range(0,len(lBilder4)):
-                listPathBilder.insert(s,os.path.join(pathVersions[i], lBilder4[s]))
-                    
-            #listBestFitnessItVersion=np.zeros((len(listActualVersions),len(listBilder)*5)) #wenn es Overview für alle gibt 
-            listFitnessIt=[] #hier werden 200 fitnessValues pro jede Iteration gespeichert
-          
-            lenListBilder4=len(lBilder4)
-            for j in range(0,len(lBilder4)): #es gibt kein Overview für carbon_convert in 9f84163d sonst ab 0
-                
-                overviewPath=os.path.abspath(os.path.join(listPathBilder[j], "overview.txt"))
-                obj=open(overviewPath,"r")
-                gesamtStringArray=[]
-                difIt=[]
-                fitIt=np.zeros((202,len(listActualVersions))) #202generaionen
-                #fig = plt.figure('Version' + str(listActualVersions[i]) + 'Bild: ' + str(lBilder4[j]) ,figsize=(10,5))
-                m=(i*lenListBilder4)+j
-                axs=fig.add_subplot(len(listActualVersions),lenListBilder4,m+1)
-                #plt.figure(j+4+i)
-                legend=0
-                legend2=0
-                for k in range(5):# Anzahl Iterationen
-                    gesamtStringArray.insert(k,obj.readline())
-                    charLine=gesamtStringArray[k].split()
-                    floatValue=float(charLine[4])
-                    bestFitnessValues.insert(k,floatValue)
-                    #listFitnessIt.insert(k*j,floatValue)
-                    dif=[]
-                    fb=[]
-                    #200fitness Values pro jede Iteration
-                    analyzerPath=os.path.abspath(os.path.join(listPathBilder[j], "Analyzer",str(k), "BestIndividualFit.txt" ))
-                    objBestFit=open(analyzerPath,"r")
-                    readFitness=[]
-                    #fitIt=[]
-                    for l in range(202):
-                        readFitness.insert(l,objBestFit.readline())      
-                    for m in range(1,202):
-                        temp=list(readFitness[m].split()[0])
-                        fit=""
-                        for n in range(len(temp)):
-                            if(temp[n]=='.'):
-                                fit=fit+temp[n-1]
-                                indexPunkt=temp.index('.')
-                                for t in range(indexPunkt, len(temp)):
-                                    fit=fit+temp[t]
-                        if(fit==''):
-                            fit=0.0
-                        else:
-                            fit=float(fit)
-                        dif1=1.0-fit
-                        dif.insert(m-1,dif1)
-                        #dif.insert(202*k+m-1,dif1)
-                        listFitnessIt.insert(202*k+m-1,fit)
-                        fitIt[m][i]=fit
-                        fb.insert(m-1,fit)
-                        #fitIt[i].insert(m-1,fit)
-                    
-                        difMean=np.average(dif)
-                        difIt.append(difMean)
-                        #print("fitIt: " + str(k) + "Version:" + str(listVersions[0]) + "Bild" + str(listBilder[0][j]))
-                        sizefb=len(fb)
-                        
-                    axs.plot(np.linspace(0,sizefb,sizefb),fb,label='Iteration: ' + str(k))
-                    #plt.title("Version: "+ str(listActualVersions[i])+" Image: " + str(lBilder4[j]))
-                    axs.set_title("Version: "+ str(listActualVersions[i])+" Image: " + str(lBilder4[j]))
-                    axs.set_xlabel("Generationen")
-                    axs.set_ylabel("Fitness")
-                    axs.legend()
-                    
-                    #fig.add_subplot(len(listActualVersions),lenListBilder,j)
-                    #pathNewBilder=os.path.abspath(os.path.join("gonzalez","Documents","compareResults","Bilder"))
-                    #plt.savefig(os.path.join(pathNewBilder,"Version_"+ str(listActualVersions[i])+ "__Bild_"+ str(listBilder[0][j])))
-                    
-                    objBestFit.close()
-                
-                  
-            listBestFitnessItVersion[i]=bestFitnessValues
-            #print(bestFitnessValues)
-            listMean.insert(i,np.mean(bestFitnessValues)) #index 0=mean of version 09ed8a63
-            listStd.insert(i,np.std(bestFitnessValues))
-            #print("Fitness values: ")
-            #print(fitnessValues)
             print("Mean: ")
             print(listMean[i])
             file.write("Mean: " + str(listMean[i]) + os.linesep)
-            #print("Mean2: ")
-            #print(np.average(listFitnessIt))
             print("Sdt: ")
             print(listStd[i])
             file.write("Std: " + str(listStd[i]) + os.linesep)
-            
-    
             print("Durchschnitt der Differenz insgesamt: ")
-            print(np.average(difIt))
-            file.write("Durchschnitt der Differenr insgesamt: " + str(np.average(difIt)) + os.linesep)
+            print(np.nanmean(difIt[i]))
+            file.write("Durchschnitt der Differenr insgesamt: " + str(np.nanmean(difIt[i])) + os.linesep)
             print("Min Fitness: ")
-            print(np.min(listFitnessIt))
-            file.write("Min Fitness: " + str(np.min(listFitnessIt)) + os.linesep)
+            print(np.nanmin(fitness[i]))
+            file.write("Min Fitness: " + str(np.nanmin(fitness[i])) + os.linesep)
             print("Max Fitness: ")
-            print(np.max(listFitnessIt))
-            file.write("Max Fitness: " + str(np.max(listFitnessIt)) + os.linesep)
-            
-        
-            
-            obj.close()
-        
-        plt.savefig(os.path.join(resultBilderPath,"Version_"+ str(listActualVersions[i])+ "__Bild_"+ str(lBilder4[j])))
-            
-        
-        f=plt.figure(figsize=(10,len(listActualVersions)*8))
-        #plt.title("Normal distribution and Histogram of best fitness values" )
-        f.subplots_adjust(hspace=0.4,wspace=0.4)
-        #f=plt.figure("Normal distribution and Histogram of best fitness values" )   
-    
-        #plt.title("Normal distribution and Histogram of best fitness values")   
-        for i in range(len(listActualVersions)):
-            normal=stats.norm(loc=listMean[i],scale=listStd[i])
-            x=np.linspace(normal.ppf(0.001),normal.ppf(0.999),100)
-            normalDichte=normal.pdf(x)
-            axs2=f.add_subplot(len(listActualVersions),1,(i+1))
-            plt.plot(x,normalDichte)
-            
-            for h in range(len(lBilder4)):
-                fit=[]
-                for w in range(5):
-                    m=(h*5)+w
-                    fit.append(listBestFitnessItVersion[i][m])
-                #meanFit=np.mean(fit)
-                #stdFit=np.std(fit)
-                #normal0=stats.norm(loc=meanFit,scale=stdFit)
-                #x=np.linspace(normal0.ppf(0.001),normal0.ppf(0.999),100)
-                #normalDichte=normal0.pdf(x)
-                plt.hist(fit,label=lBilder4[h])
-                plt.title( "Normal distribution and Histogram of best fitness values (Version: "+str(listActualVersions[i]) +")" )
-                plt.xlabel("Fitness")
-                plt.ylabel("Frequency")
-                plt.legend()
-            
-        plt.savefig(os.path.join(resultBilderPath,"Normal distribution" + "_version"+ str(listActualVersions[i])))
-        
-else:
-    print("First parameter should be the data directory, second parameter should be the results directory,third and fourth the commit hashes that are to be compared, i.e.: <data_dir> <results_dir> <hashA> <hashB>")  
-  
+            print(np.nanmax(fitness[i]))
+            file.write("Max Fitness: " + str(np.nanmax(fitness[i])) + os.linesep)
+
+    figurePaths=plotFitnessCurves(fitness,listActualVersions,lBilder,resultBilderPath,args.workers or os.cpu_count())
+    if args.contact_sheet:
+        createContactSheet(figurePaths,os.path.join(resultBilderPath,"Kontaktabzug.png"))
+    plotBestFitnessHistograms(bestFitness,listMean,listStd,listActualVersions,lBilder,
+                              os.path.join(resultBilderPath,"Normal distribution" + "_version"+ str(listActualVersions[-1])))
+
+    if args.convergence:
+        generationsTo,auc,profile=convergenceMetrics(fitness,args.convergence_thresholds)
+        convergence=summarizeConvergence(generationsTo,auc,profile,listActualVersions,lBilder)
+        with open(os.path.join(dirResults,"convergence.json"),'w') as f:
+            json.dump({'thresholds':args.convergence_thresholds,'versions':convergence},f,indent=2)
+        plotAnytimeProfile(profile,listActualVersions,os.path.join(resultBilderPath,"Anytime.png"))
+        print("")
+        print("Konvergenz: ")
+        for c in convergence:
+            print("Version: " + c['version'] + ", AUC: " + str(c['auc_mean']) + " (Std: " + str(c['auc_std']) + ")")
+            for threshold in args.convergence_thresholds:
+                print("  Generationen bis " + str(threshold) + ": " +
+                      str(c['generations_to_threshold'][str(threshold)]) +
+                      " (erreicht: " + str(c['reached'][str(threshold)]) + ")")
+
+    if args.gate:
+        gateResults=regressionGate(bestFitness,listActualVersions,lBilder,args.alpha,args.threshold,args.bootstrap,
+                                   args.seed)
+        writeGateJson(gateResults,listActualVersions[0],args.alpha,args.threshold,
+                      args.json or os.path.join(dirResults,"regressionGate.json"))
+        writeGateJUnit(gateResults,listActualVersions,args.junit or os.path.join(dirResults,"regressionGate.xml"))
+        print("")
+        print("Regression gate (baseline " + listActualVersions[0] + "): ")
+        for r in gateResults:
+            print(("REGRESSION " if r['regression'] else "ok ") + r['version'] + " " + describeResult(r))
+        if missingVersions or len(listActualVersions)<2 or any(r['regression'] for r in gateResults):
+            sys.exit(1)
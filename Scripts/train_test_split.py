@@ -9,75 +9,172 @@ dir
             image_a
             ...
 
-and splits it into train, test and validation sets.
+and splits it into train, test and validation sets (60/20/20). Images and labels are paired by their names without
+extension.
 
-It also splits the test set further into very small sets of 1, 5, 10 for a total of 5 runs each and copies the
-appropriate files into their own directories.
+It also splits the train set further into very small sets (--sizes, default 1, 3, 5, 10, 25, 50) for a total of
+--runs runs each (default 5) and copies the appropriate files into their own directories.
+
+All splits are drawn from a seeded generator (--seed) and stratified (--stratify): by the ratio of labelled pixels,
+binned into --strata quantiles with empty labels in a stratum of their own, or by the set of classes (label values)
+in a label. Every stratum gets its share of every split; a subset that has at least as many images as there are
+strata contains an image of every stratum that is left in the train set. The labels are read once, in parallel.
+
+All splits are also listed in output_folder/manifest.json together with the seed (see manifest.py). With
+--manifest-only no files are put into the split directories; manifest.py builds the directory of a split when a batch
+run needs it.
 """
-from sklearn.model_selection import train_test_split
+import argparse
 import os
-import sys
-from pathlib import Path
-import shutil
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
 import numpy as np
-
-input_folder = sys.argv[1]
-output_folder = sys.argv[2]
+from PIL import Image
+from materialize import add_link_mode_argument
+from manifest import MANIFEST_NAME, materialize_split, write_manifest
+
+STRATIFY_MODES = ['foreground', 'class', 'none']
+
+
+def index_files(directory):
+    # avoid .db files that microsoft likes to put everywhere for thumbnails
+    return {os.path.splitext(x)[0]: os.path.join(directory, x) for x in os.listdir(directory) if not x.endswith('.db')}
+
+
+def label_statistics(label_path):
+    """
+        Ratio of labelled (non-zero) pixels and the sorted label values other than 0 of a label image.
+    """
+    label = np.asarray(Image.open(label_path))
+    if label.ndim == 3:
+        values = np.unique(label.reshape(-1, label.shape[2]), axis=0)
+        values = [tuple(int(c) for c in v) for v in values if v.any()]
+        foreground = np.count_nonzero(label.any(axis=2))
+    else:
+        values = [int(v) for v in np.unique(label) if v != 0]
+        foreground = np.count_nonzero(label)
+    return foreground / max(label.shape[0] * label.shape[1], 1), values
+
+
+def label_strata(label_paths, mode, strata=4, workers=None):
+    """
+        Stratum (a string) of every label.
+    """
+    if mode == 'none':
+        return ['all'] * len(label_paths)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        statistics = list(executor.map(label_statistics, label_paths))
+    if mode == 'class':
+        return ['+'.join(str(v) for v in values) or 'empty' for _, values in statistics]
+    ratios = np.array([ratio for ratio, _ in statistics])
+    edges = np.unique(np.quantile(ratios[ratios > 0], np.linspace(0, 1, strata + 1)[1:-1])) if ratios.any() else []
+    return ['empty' if ratio == 0 else f'foreground{np.searchsorted(edges, ratio, side="right")}' for ratio in ratios]
+
+
+def allocate(counts, total, rng, cover=False):
+    """
+        Splits total over the strata in proportion to their counts. The remainder of the rounding goes to strata drawn
+        with probabilities in proportion to their fractional shares. With cover, every stratum with members gets at
+        least one, if total allows it.
+    """
+    counts = np.asarray(counts)
+    if total > counts.sum():
+        raise ValueError(f'cannot take {total} of {counts.sum()} images')
+    quotas = counts * total / max(counts.sum(), 1)
+    shares = np.floor(quotas).astype(int)
+    fractions = quotas - shares
+    remainder = total - shares.sum()
+    if remainder > 0:
+        shares[rng.choice(len(counts), size=remainder, replace=False, p=fractions / fractions.sum())] += 1
+    if cover and total >= np.count_nonzero(counts):
+        for i in np.flatnonzero((shares == 0) & (counts > 0)):
+            shares[np.argmax(shares)] -= 1
+            shares[i] += 1
+    return shares
+
+
+def stratified_split(members, sizes, rng):
+    """
+        Splits the members ({stratum: [index, ...]}) into parts of the given sizes, every part stratified.
+    """
+    pools = {s: list(rng.permutation(m)) for s, m in members.items()}
+    parts = []
+    for size in sizes:
+        strata = list(pools)
+        shares = allocate([len(pools[s]) for s in strata], size, rng, cover=True)
+        part = []
+        for s, share in zip(strata, shares):
+            part.extend(pools[s][:share])
+            pools[s] = pools[s][share:]
+        parts.append(sorted(part))
+    return parts
+
+
+parser = argparse.ArgumentParser(description='Splits a dataset in image/label format into train, val and test sets')
+parser.add_argument('input_folder', help='dataset with images and labels directories')
+parser.add_argument('output_folder', help='directory of the train, val, test and train_experiment sets')
+add_link_mode_argument(parser)
+parser.add_argument('--seed', type=int, default=None,
+                    help='seed of the splits, written to the manifest (default: a random seed)')
+parser.add_argument('--stratify', choices=STRATIFY_MODES, default='foreground',
+                    help='stratify the splits by the ratio of labelled pixels, by the classes in the label, or not at '
+                         'all (default: foreground)')
+parser.add_argument('--strata', type=int, default=4,
+                    help='number of foreground ratio strata of the non-empty labels (default: 4)')
+parser.add_argument('--sizes', type=int, nargs='+', default=[1, 3, 5, 10, 25, 50],
+                    help='sizes of the train_experiment subsets (default: 1 3 5 10 25 50)')
+parser.add_argument('--runs', type=int, default=5, help='number of disjoint subsets of every size (default: 5)')
+parser.add_argument('--workers', type=int, default=0, help='number of threads reading the labels, 0 uses all cores')
+parser.add_argument('--manifest-only', action='store_true',
+                    help=f'only write the splits to output_folder/{MANIFEST_NAME}, without files in split directories')
+args = parser.parse_args()
+
+input_folder = args.input_folder
+output_folder = args.output_folder
+seed = args.seed if args.seed is not None else int(np.random.SeedSequence().entropy % 2 ** 32)
+rng = np.random.default_rng(seed)
 
 label_dir_name = "labels"
 image_dir_name = "images"
 
-label_dir = os.path.join(input_folder, label_dir_name)
-image_dir = os.path.join(input_folder, image_dir_name)
-
-label_paths = [Path(os.path.join(label_dir, x)) for x in os.listdir(label_dir) if not x.endswith('.db')]
-image_paths = [Path(os.path.join(image_dir, x)) for x in os.listdir(image_dir) if not x.endswith('.db')]
-image_paths.sort()
-label_paths.sort()
-pairs = zip(image_paths,label_paths)
-
-train, rest = train_test_split(list(pairs), test_size=0.4, shuffle=True)
-val, test = train_test_split(rest, test_size=0.5, shuffle=True)
+images = index_files(os.path.join(input_folder, image_dir_name))
+labels = index_files(os.path.join(input_folder, label_dir_name))
+unmatched = sorted(set(images) ^ set(labels))
+if unmatched:
+    raise SystemExit(f"Images and labels without a partner of the same name: {unmatched}")
+names = sorted(images)
+pairs = [(images[n], labels[n]) for n in names]
+
+strata = label_strata([label for _, label in pairs], args.stratify, args.strata, args.workers or os.cpu_count())
+members = {}
+for i, stratum in enumerate(strata):
+    members.setdefault(stratum, []).append(i)
+print("strata: " + ", ".join(f"{s} ({len(m)})" for s, m in sorted(members.items())))
+
+# same sizes as sklearn's train_test_split with test_size=0.4, then 0.5
+num_rest = int(np.ceil(0.4 * len(pairs)))
+num_test = int(np.ceil(0.5 * num_rest))
+train, val, test = stratified_split(members, [len(pairs) - num_rest, num_rest - num_test, num_test], rng)
+splits = {"train": [pairs[i] for i in train], "val": [pairs[i] for i in val], "test": [pairs[i] for i in test]}
+
+train_members = {}
+for i in train:
+    train_members.setdefault(strata[i], []).append(i)
+for size in args.sizes:
+    if size * args.runs > len(train):
+        raise SystemExit(f"{args.runs} subsets of {size} images need {size * args.runs} images, the train set has "
+                         f"{len(train)}")
+    # a new generator per size, so adding or removing a size does not change the subsets of the other sizes
+    subsets = stratified_split(train_members, [size] * args.runs, np.random.default_rng([seed, size]))
+    for run, subset in enumerate(subsets):
+        splits[f"train_experiment/{size}/{run}/train"] = [pairs[i] for i in subset]
 
 with suppress(FileExistsError):
-    for x in ["train", "val", "test"]:
-        for y in ["images", "labels"]:
-            os.makedirs(os.path.join(output_folder, x, y))
-
-
-for d, x in zip(["train", "val", "test"], [train, val, test]):
-    for image, label in x:
-        assert image.stem == label.stem, f"{image.stem} != {label.stem}"
-        shutil.copyfile(image,
-                        os.path.join(output_folder, d, "images", image.name))
-        shutil.copyfile(label,
-                        os.path.join(output_folder, d, "labels", label.name))
-
-
-train_images_new = [Path(os.path.join(output_folder, "train", "images", x))
-                  for x in os.listdir(os.path.join(output_folder, "train", "images")) if not x.endswith('.db')]
-train_images_new.sort()
-train_labels_new = [Path(os.path.join(output_folder, "train", "labels", x))
-                  for x in os.listdir(os.path.join(output_folder, "train", "labels")) if not x.endswith('.db')]
-train_labels_new.sort()
-
-train_paths = np.array(list(zip(train_images_new, train_labels_new)))
-
-assert all([x.stem == y.stem for x, y in train_paths])
-
-num_runs = 5
-for size in [1, 3, 5, 10, 25, 50]:
-    indices = np.random.choice(range(0, len(train_paths)), size=size*num_runs, replace=False)
-    for run, chunk in zip(range(0, num_runs), np.array_split(indices, num_runs)):
-        out_dir = os.path.join(output_folder, "train_experiment", str(size), str(run), "train")
-        with suppress(FileExistsError):
-            for x in ["images", "labels"]:
-                os.makedirs(os.path.join(out_dir, x))
-        for image, label in [train_paths[i] for i in chunk]:
-            assert image.stem == label.stem, f"{image.stem} != {label.stem}"
-            shutil.copyfile(image, os.path.join(out_dir, "images", image.name))
-            shutil.copyfile(label, os.path.join(out_dir, "labels", label.name))
-
-        assert len(os.listdir(os.path.join(out_dir, "labels"))) == len(os.listdir(os.path.join(out_dir, "images")))
-
+    os.makedirs(output_folder)
+parameters = {"stratify": args.stratify, "strata": args.strata, "sizes": args.sizes, "runs": args.runs}
+write_manifest(os.path.join(output_folder, MANIFEST_NAME), input_folder, splits, seed, parameters)
+print(f"seed {seed}, manifest written to {os.path.join(output_folder, MANIFEST_NAME)}")
+
+if not args.manifest_only:
+    for name, split in splits.items():
+        materialize_split(split, os.path.join(output_folder, *name.split("/")), args.link_mode)
@@ -6,272 +6,308 @@ Created on Fri May 15 11:39:55 2020
 """
 
 import argparse
+import functools
 import os
-from PIL import Image,ImageOps  
+import time
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
 import numpy as np
-from skimage.io import imread, imsave
-import skimage.io as io
-
-from matplotlib import pyplot
-from skimage import color
-from skimage import data
-from skimage.util import crop, pad
-from skimage.util import pad
-
-import matplotlib.pylab as plt
-
-parser=argparse.ArgumentParser(description='Transform images')
-
-parser.add_argument('data_directory',
-                    help='directory containing images in images/labels format')
-
-parser.add_argument('transform_results_directory',
-                    help='result directory to place transformed images in')
-
-parser.add_argument('--split', 
-                    type=int,
-                    default=0,
-                    help='Crop a big picture into several small size pictures')
-
-#1=True and 0=False
-parser.add_argument('--cropRegions',
-                    default=0, 
-                    help='Crop around regions of interest. Parameters expected: 0 or 1')
-
-parser.add_argument('--resize',
-                    default=0,
-                    help='resize an image with factor n')
-
-args=parser.parse_args()
-
-
-train_data=args.data_directory
-
-splitFactor=args.split
-resizeFactor=args.resize
-cropParameter=args.cropRegions
-dirResults=args.transform_results_directory
-
-funktionen=[]
-if(splitFactor!=0):
-    funktionen.append("split")
-if(cropParameter!=0):
-    funktionen.append("crop")
-if(resizeFactor!=0):
-    funktionen.append("resize")
-print(funktionen)
-
-
-dirGesamtTrainImages=[]
-dirGesamtTrailLabels=[]
-dirGesamtBilder=[]
-dirGesamtBilder.append(os.path.join(train_data,"images"))
-dirGesamtBilder.append(os.path.join(train_data,"labels"))
-
-
-listNameImages=[]
-
-
-for i in range(len(dirGesamtBilder)):
-    # avoid .db files that microsoft likes to put everywhere for thumbnails
-    listNameImages.append([x for x in os.listdir(dirGesamtBilder[i]) if '.db' not in x])
-    
-
-#Images und Labels sollen derselbe Name und derselbe size haben 
-def matchNames_size():
-    temp=False
-    for i in range(len(listNameImages)):
-        if(i%2==0):
-            temp=False
-            if(len(listNameImages[i])==len(listNameImages[i+1])):
-                temp=True
-                for k in range(len(listNameImages[i])):
-                    namestr=os.path.splitext(listNameImages[i][k])
-                    namestr2=os.path.splitext(listNameImages[i+1][k])
-                    dirImg=os.path.join(dirGesamtBilder[i],listNameImages[i][k])
-                    dirImg2=os.path.join(dirGesamtBilder[i+1],listNameImages[i+1][k])
-                    img=Image.open(dirImg)
-                    img2=Image.open(dirImg2)
-                    if(namestr[0]==namestr2[0] and temp==True and img.size==img2.size):
-                        temp=True
-                    else: temp=False
-                    img.close()
-                    img2.close()
-       
-    if(temp==True):
-        print(temp)
-        return True                
+from scipy import ndimage
+
+"""
+Transforms a dataset in images/labels format. Every image/label pair is streamed through the pipeline
+
+    validate -> crop -> resize -> split -> tile -> save
+
+in a pool of worker processes. Each file is decoded exactly once; the stages work on the decoded arrays. A stage
+turns one pair into any number of pairs (crop with --cropEachRegion, split), the names of the results are built from
+the name of the image and the suffixes of the stages, e.g. image_crop_resize_split_0.png or image_tile_<y>_<x>.png.
+If resize is the only stage, the results are named resize_<name> as before.
+"""
+
+
+def tileShape(value):
+    """
+    "n" or "HxW" as (H, W).
+    """
+    parts=[int(x) for x in value.lower().split('x')]
+    if(len(parts)==1):
+        parts=parts*2
+    if(len(parts)!=2 or min(parts)<0):
+        raise argparse.ArgumentTypeError("expected n or HxW, got "+value)
+    return tuple(parts)
+
+
+def parseArgs():
+    parser=argparse.ArgumentParser(description='Transform images')
+
+    parser.add_argument('data_directory',
+                        help='directory containing images in images/labels format')
+
+    parser.add_argument('transform_results_directory',
+                        help='result directory to place transformed images in')
+
+    parser.add_argument('--split',
+                        type=int,
+                        default=0,
+                        help='Crop a big picture into several small size pictures')
+
+    #1=True and 0=False
+    parser.add_argument('--cropRegions',
+                        type=int,
+                        default=0,
+                        help='Crop around regions of interest. Parameters expected: 0 or 1')
+
+    parser.add_argument('--cropMargin',
+                        type=int,
+                        default=0,
+                        help='Margin in pixels added around each region of interest when cropping')
+
+    #1=True and 0=False
+    parser.add_argument('--cropEachRegion',
+                        type=int,
+                        default=0,
+                        help='Crop every connected region of interest into its own image. Parameters expected: 0 or 1')
+
+    parser.add_argument('--resize',
+                        type=float,
+                        default=0,
+                        help='resize an image with factor n')
+
+    parser.add_argument('--tileSize',
+                        type=tileShape,
+                        default=None,
+                        help='Cut every image into tiles of size n or HxW (e.g. 256 or 256x512)')
+
+    parser.add_argument('--tileStride',
+                        type=tileShape,
+                        default=None,
+                        help='Distance between the tiles, n or HxW (default: tile size minus overlap)')
+
+    parser.add_argument('--tileOverlap',
+                        type=tileShape,
+                        default=(0,0),
+                        help='Overlap of neighbouring tiles in pixels, n or HxW, if no stride is given (default: 0)')
+
+    #1=True and 0=False
+    parser.add_argument('--skipEmptyTiles',
+                        type=int,
+                        default=0,
+                        help='Do not save tiles whose label is empty. Parameters expected: 0 or 1')
+
+    parser.add_argument('--workers',
+                        type=int,
+                        default=0,
+                        help='number of worker processes, 0 uses all cores')
+
+    args=parser.parse_args()
+    if(args.tileSize is not None):
+        if(min(args.tileSize)<=0):
+            parser.error("--tileSize has to be positive")
+        if(args.tileStride is None):
+            if(args.tileOverlap[0]>=args.tileSize[0] or args.tileOverlap[1]>=args.tileSize[1]):
+                parser.error("--tileOverlap has to be smaller than --tileSize")
+            args.tileStride=(args.tileSize[0]-args.tileOverlap[0],args.tileSize[1]-args.tileOverlap[1])
+        if(min(args.tileStride)<=0):
+            parser.error("--tileStride has to be positive")
+    return args
+
+
+#Images und Labels sollen derselbe Name haben
+def listPairs(dataDir):
+    """
+    (image path, label path) of all images with a label of the same name (without extension).
+    Also returns the names that have no partner.
+    """
+    names=[]
+    for subDir in ["images","labels"]:
+        # avoid .db files that microsoft likes to put everywhere for thumbnails
+        files=[x for x in os.listdir(os.path.join(dataDir,subDir)) if '.db' not in x]
+        names.append({os.path.splitext(x)[0]:os.path.join(dataDir,subDir,x) for x in files})
+    images,labels=names
+    pairs=[(images[n],labels[n]) for n in sorted(images) if n in labels]
+    unmatched=sorted(set(images)^set(labels))
+    return pairs, unmatched
+
+
+'''
+================== Stages ==================
+A stage takes (suffixes, image, label) and returns a list of such triples.
+'''
+#Crop around regions of interest (such as the smallest rectangle containing a region of interest)
+def regionBoxes(labelArray,margin=0,eachRegion=False):
+    """
+    Bounding boxes (as pairs of slices) of the labelled pixels, grown by margin pixels and clipped to the label.
+    One box around all labelled pixels, or with eachRegion one box per connected region. No box for an empty label.
+    """
+    mask=labelArray!=0
+    if(eachRegion):
+        boxes=ndimage.find_objects(ndimage.label(mask)[0])
     else:
-        print("Names or size of images are different")
-    
-    
-#os.path.abspath entfernen
-#para cada imagen no es necesario un directorio 
-dirResultsImage=os.path.join(dirResults, "images")
-dirResultsLabels=os.path.join(dirResults,"labels")
-
-widthImages=[]
-heightImages=[]
-
-#jeder Bild wird in kleinere Bilder geteilt. SplitFactor=Anzahl von kleinere Bilder
-#d.h wenn splitFactor=4 wird jede Bild in 4 kleinere Bilder geteilt 
-def split(img,i,nameBild):
-    #print(img.height, img.width)
-    nameBild2=os.path.splitext(nameBild)
-    nameBild3=nameBild2[0]
-    temp2=nameBild2[1]
-    width=img.shape[1]
-    temp=width/splitFactor
-    if(i==0):
-        #print("Image")
-        for k in range(splitFactor):
-            j=width-((k+1)*temp)
-            #if(len(img.shape)==2):
-            cropImage=crop(img,((0,0),(k*temp,j)),copy=False)
-            #print(cropImage.shape)
-            dirResultsImages=os.path.abspath(os.path.join(dirTrainImagesResults, nameBild3+"_split_"+str(k)+temp2))
-            imsave(dirResultsImages,cropImage)
-            
-    if(i==1):
-        #print("Image")
-        for k in range(splitFactor):
-            j=width-((k+1)*temp)
-            #if(len(img.shape)==2):
-            cropImage=crop(img,((0,0),(k*temp,j)),copy=False)
-            #print(cropImage.shape)
-            dirResultsImages=os.path.abspath(os.path.join(dirTrainLabelsResults, nameBild3+"_split_"+str(k)+temp2))
-            imsave(dirResultsImages,cropImage)
+        rows=np.flatnonzero(np.any(mask,axis=1))
+        cols=np.flatnonzero(np.any(mask,axis=0))
+        if(len(rows)==0):
+            return []
+        boxes=[(slice(rows[0],rows[-1]+1),slice(cols[0],cols[-1]+1))]
+    height,width=mask.shape
+    return [(slice(max(r.start-margin,0),min(r.stop+margin,height)),
+             slice(max(c.start-margin,0),min(c.stop+margin,width))) for r,c in boxes]
+
+
+def cropStage(pair,margin=0,eachRegion=False):
+    suffixes,img,label=pair
+    boxes=regionBoxes(label,margin,eachRegion)
+    if(eachRegion):
+        #eine Datei pro Region: name_crop_<n>.ext
+        return [(suffixes+["crop",str(n)],img[box],label[box]) for n,box in enumerate(boxes)]
+    return [(suffixes+["crop"],img[box],label[box]) for box in boxes]
+
 
 #jeder Bild wird um ein Factor n resize. Z.B: ein Bild mit width=100 und resizeFator=0.8 wird eine neue width=80 haben.
-def resize(imgDir,factor,i,nameBild):
-    nameBild2=list(nameBild)
-    nameBild3=""
-    #print(nameBild2)
-    for m in range(len(nameBild2)-4):
-        nameBild3=nameBild3+nameBild[m]
-    
-    img=Image.open(imgDir)
-    width=int(round(img.size[0]*float(factor),0))
-    height=int(round(img.size[1]*float(factor),0))
-    reImage=img.resize((width,height),Image.NEAREST)
-    
-    if(i!=0 and i!=1 and i!=2 and i!=3 ):
-        return reImage
-    if(i==0):                
-        dirResultsImages=os.path.join(dirTrainImagesResults, "resize_"+nameBild)
-        reImage.save(dirResultsImages)
-        
-    if(i==1):           
-        dirResultsImages=os.path.join(dirTrainLabelsResults,"resize_" +nameBild)
-        reImage.save(dirResultsImages)
+def resizeArray(array,factor):
+    width=int(round(array.shape[1]*factor,0))
+    height=int(round(array.shape[0]*factor,0))
+    return np.asarray(Image.fromarray(array).resize((width,height),Image.NEAREST))
 
-#Crop around regions of interest (such as the smallest rectangle containing a region of interest)
-def cropImg(dirImg,nameBild,dirCropRes):
-    
-    img=Image.open(dirImg[0]).convert('L')
-    #label=Image.open(dirImg[1])
-    label=Image.open(dirImg[1]).convert('L')
-    labelW=label.width
-    labelH=label.height
-    labelArray=np.asarray(label)
-    labelIndexI=[]
-    labelIndexJ=[]
-    
-    for i in range(labelArray.shape[0]):
-        for j in range(labelArray.shape[1]):
-            if(labelArray[i][j]!=0):
-                labelIndexI.append(i)
-                labelIndexJ.append(j)
-                    
-    labelIarray=np.asarray(labelIndexI)
-    labelJarray=np.asarray(labelIndexJ)
-    minIndexI=np.amin(labelIarray) 
-    maxIndexI=np.amax(labelIarray) #max index for height 
-    minIndexJ=np.amin(labelJarray)
-    maxIndexJ=np.amax(labelJarray) #max index for width
-    k=labelW-maxIndexJ
-    m=labelH-maxIndexI
-    cropLabel=crop(label,((minIndexI,m),(minIndexJ,k)),copy=False)
-    cropImage=crop(img,((minIndexI,m),(minIndexJ,k)),copy=False)
-    imsave(dirCropRes[0],cropImage)
-    imsave(dirCropRes[1],cropLabel)
-    
-if(matchNames_size()==1):
-    #print(listNameImages)
-    #namestr=list(listNameImages[0][0])
-    #nameBild=""
-    dirImg=[]
-
-    #dirResultName=os.path.join(dirResults,nameBild)
-    dirTrainImagesResults=os.path.join(dirResults,"images")
-    dirTrainLabelsResults=os.path.join(dirResults,"labels")
-
-
-    for d in [dirResults, dirTrainImagesResults,
-              dirTrainLabelsResults]:
-        try: os.makedirs(d)
-        except FileExistsError: pass
-
-    cropImgI=[]
-    cropImgName=[]
-    for i in range(len(dirGesamtBilder)):
-        for j in range(len(listNameImages[i])):        
-            dirImage=os.path.join(dirGesamtBilder[i],listNameImages[i][j])
-            nameBild=listNameImages[i][j]
-            if(cropParameter!=0):
-                cropImgI.append(dirImage)
-                cropImgName.append(nameBild)
-                w=len(listNameImages[0])*2
-                v=len(listNameImages[0])*2
-                if(len(cropImgI)%w==0 or len(cropImgI)%(v+w)==0):
-                    for t in range(len(listNameImages[i])):
-                        if(len(cropImgI)==2*len(listNameImages[0])):                            
-                            n=len(listNameImages[i])+t
-                            dirImg.append(cropImgI[t])
-                            dirImg.append(cropImgI[n])
-                            cropImgName2=[]
-                            cropImgName2.append(cropImgName[t])
-                            cropImgName2.append(cropImgName[n])
-                            if(len(dirImg)%2==0):
-                                nameBild1=os.path.splitext(cropImgName2[0])
-                                nameBild2=os.path.splitext(cropImgName2[1])
-                                nameBild1_1=nameBild1[0]
-                                nameBild2_2=nameBild2[0]
-                                temp1=nameBild1[1]
-                                temp2=nameBild2[1]              
-                            
-                                dirCropRes=[]
-                                if(resizeFactor!=0):
-                                    dirResultsCropI=os.path.abspath(os.path.join(dirTrainImagesResults, nameBild1_1+"_"+"crop"+"_resize"+temp2))
-                                    dirResultsCropL=os.path.abspath(os.path.join(dirTrainLabelsResults, nameBild2_2+"_"+"crop"+"_resize"+temp2))
-                                    dirCropRes.append(dirResultsCropI)
-                                    dirCropRes.append(dirResultsCropL)
-                                else:
-                                    dirResultsCropI=os.path.abspath(os.path.join(dirTrainImagesResults, nameBild1_1+"_"+"crop"+temp2))
-                                    dirResultsCropL=os.path.abspath(os.path.join(dirTrainLabelsResults, nameBild2_2+"_"+"crop"+temp2))
-                                    dirCropRes.append(dirResultsCropI)
-                                    dirCropRes.append(dirResultsCropL)
-                                
-                                cropImg(dirImg,nameBild,dirCropRes)
-                                dirImg=[]
-
-            if(resizeFactor!=0 and cropParameter==0 and splitFactor==0): 
-                resize(dirImage,resizeFactor,i,nameBild)
-                
-            if(splitFactor!=0):
-                img = Image.open(dirImage).convert('L')
-                width=img.width
-                        
-                if(width%splitFactor==0):
-                    split(img,i,nameBild)    
-                else:
-                    temp=0
-                    while(width%splitFactor!=0):
-                        width=width+temp
-                        temp=temp+1
-                        padImage=pad(img,((0,0),(0,temp)),'constant')
-                    split(padImage,i,nameBild)
-                img.close()
-else:
-    print("In the given directory are not the correct Images")
-#print(train_data)
+
+def resizeStage(pair,factor):
+    suffixes,img,label=pair
+    return [(suffixes+["resize"],resizeArray(img,factor),resizeArray(label,factor))]
+
+
+#jeder Bild wird in kleinere Bilder geteilt. splitFactor=Anzahl von kleinere Bilder
+#d.h wenn splitFactor=4 wird jede Bild in 4 kleinere Bilder geteilt. Die Breite wird mit 0 auf ein Vielfaches aufgefüllt.
+def splitArray(array,splitFactor):
+    padding=-array.shape[1]%splitFactor
+    if(padding):
+        array=np.pad(array,[(0,0),(0,padding)]+[(0,0)]*(array.ndim-2),'constant')
+    return np.split(array,splitFactor,axis=1)
+
+
+def splitStage(pair,splitFactor):
+    suffixes,img,label=pair
+    return [(suffixes+["split",str(k)],i,l)
+            for k,(i,l) in enumerate(zip(splitArray(img,splitFactor),splitArray(label,splitFactor)))]
+
+
+#Kacheln mit Überlappung: die letzte Kachel einer Zeile/Spalte schließt bündig mit dem Rand ab
+def tileStarts(length,tile,stride):
+    if(length<=tile):
+        return [0]
+    starts=list(range(0,length-tile+1,stride))
+    if(starts[-1]!=length-tile):
+        starts.append(length-tile)
+    return starts
+
+
+def tileStage(pair,tileSize,stride,skipEmpty=False):
+    """
+    Cuts image and label into the same tiles. The tiles are views of the decoded arrays (no copies); tiles at the
+    border are moved inwards so all tiles have the full size (unless the image is smaller than a tile).
+    """
+    suffixes,img,label=pair
+    height,width=label.shape[:2]
+    tileH,tileW=min(tileSize[0],height),min(tileSize[1],width)
+    tiles=[]
+    for y in tileStarts(height,tileH,stride[0]):
+        for x in tileStarts(width,tileW,stride[1]):
+            labelTile=label[y:y+tileH,x:x+tileW]
+            if(skipEmpty and not labelTile.any()):
+                continue
+            tiles.append((suffixes+["tile",str(y),str(x)],img[y:y+tileH,x:x+tileW],labelTile))
+    return tiles
+
+
+def buildPipeline(args):
+    """
+    The stages selected by the arguments, in the order crop, resize, split, tile.
+    """
+    stages=[]
+    if(args.cropRegions!=0):
+        stages.append(functools.partial(cropStage,margin=args.cropMargin,eachRegion=args.cropEachRegion!=0))
+    if(args.resize!=0):
+        stages.append(functools.partial(resizeStage,factor=args.resize))
+    if(args.split!=0):
+        stages.append(functools.partial(splitStage,splitFactor=args.split))
+    if(args.tileSize is not None):
+        #Kachelgröße und Schrittweite sind in parseArgs geprüft
+        stages.append(functools.partial(tileStage,tileSize=args.tileSize,stride=args.tileStride,
+                                        skipEmpty=args.skipEmptyTiles!=0))
+    return stages
+
+
+def resultName(path,suffixes):
+    name,ext=os.path.splitext(os.path.basename(path))
+    if(suffixes==["resize"]):
+        return "resize_"+name+ext
+    return "_".join([name]+suffixes)+ext
+
+
+def processPair(pair,stages,dirResults,gray):
+    """
+    Decodes one image/label pair, validates it, runs it through the stages and saves the results.
+    Returns the number of saved pairs and an error message (or None).
+    """
+    imagePath,labelPath=pair
+    img=Image.open(imagePath)
+    label=Image.open(labelPath)
+    if(img.size!=label.size):
+        return 0, "Size of image and label are different: "+imagePath
+    if(gray):
+        img=img.convert('L')
+        label=label.convert('L')
+    else:
+        #Palettenbilder verlieren sonst beim Speichern der Arrays ihre Farben
+        img=img.convert('RGB') if img.mode=='P' else img
+        label=label.convert('RGB') if label.mode=='P' else label
+    pairs=[([],np.asarray(img),np.asarray(label))]
+    for stage in stages:
+        pairs=[result for p in pairs for result in stage(p)]
+        if(len(pairs)==0):
+            if(stage.func is tileStage):
+                return 0, "All tiles of "+labelPath+" skipped, their labels are empty"
+            return 0, "No region of interest in "+labelPath
+    for suffixes,i,l in pairs:
+        Image.fromarray(i).save(os.path.join(dirResults,"images",resultName(imagePath,suffixes)))
+        Image.fromarray(l).save(os.path.join(dirResults,"labels",resultName(labelPath,suffixes)))
+    return len(pairs), None
+
+
+def transform(pairs,stages,dirResults,gray,workers=1):
+    """
+    Streams the pairs through the pipeline, in workers processes. Returns the number of saved pairs.
+    """
+    for d in [os.path.join(dirResults,"images"),os.path.join(dirResults,"labels")]:
+        os.makedirs(d,exist_ok=True)
+    process=functools.partial(processPair,stages=stages,dirResults=dirResults,gray=gray)
+    if(workers<=1):
+        return collectResults(map(process,pairs))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return collectResults(executor.map(process,pairs,chunksize=max(1,len(pairs)//(workers*8))))
+
+
+def collectResults(results):
+    saved=0
+    for count,error in results:
+        saved+=count
+        if error is not None:
+            print(error)
+    return saved
+
+
+if __name__ == '__main__':
+    args=parseArgs()
+    stages=buildPipeline(args)
+    print([s.func.__name__ for s in stages])
+    pairs,unmatched=listPairs(args.data_directory)
+    if(unmatched):
+        print("Names of images and labels are different: "+str(unmatched))
+        print("In the given directory are not the correct Images")
+    else:
+        start=time.perf_counter()
+        #crop und split arbeiten auf Graustufenbildern
+        gray=args.cropRegions!=0 or args.split!=0
+        saved=transform(pairs,stages,args.transform_results_directory,gray,args.workers or os.cpu_count())
+        seconds=time.perf_counter()-start
+        print(str(len(pairs))+" pairs transformed into "+str(saved)+" pairs in "+"{:.2f}".format(seconds)+" s ("+
+              "{:.1f}".format(len(pairs)/seconds if seconds>0 else 0)+" images/s)")